@@ -1,9 +1,12 @@
+from functools import lru_cache
+
 DEFAULT_ROLE = "assistant"
 
 TOOLS_DESCRIPTION = """
 * When the user sends a SQL query or asks about a table, use the available tools to gather information:
    - Use `get_database_info` to get an overview of the current database (size, options, number of tables, etc.).
    - Use `list_tables` to see what tables exist. Returns: table_schema, table_name, table_type, row_count, data_size_mb, indexes_size_mb.
+   - Use `describe_table` when you need several facts about one table: it returns columns, size stats, indexes, foreign keys and missing index recommendations in one call.
    - Use `get_table_structure` to understand column definitions. Also returns: row_count, data_size_mb, index_count, indexes_size_mb, data_space, data_space_type.
    - Use `get_table_type_definition` to get the T-SQL definition of a specific table type (TVP).
    - Use `get_indexes` to check existing indexes on relevant tables. Returns: 
@@ -105,3 +108,13 @@ def get_system_prompt(role: str | None) -> str:
         return ASSISTANT_PROMPT
 
     return ASSISTANT_PROMPT
+
+
+@lru_cache(maxsize=128)
+def build_system_content(role: str | None, database: str, description: str) -> str:
+    """System prompt for a role plus the current database context; memoized per (role, database, description)."""
+    db_context = f"\n\nYou are working with database: {database}."
+    if description:
+        db_context += f" User-provided context: {description}"
+    db_context += "\n"
+    return get_system_prompt(role) + db_context
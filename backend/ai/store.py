@@ -2,12 +2,15 @@
 SQLite store: database descriptions, chats, and chat messages.
 DB file: data/app.db (created on first use).
 """
-import json
 import sqlite3
-from dataclasses import dataclass
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple
 import logging
 
+import orjson
+
 from backend.config import DATA_DIR
 
 log = logging.getLogger(__name__)
@@ -15,9 +18,9 @@ log = logging.getLogger(__name__)
 DB_PATH = DATA_DIR / "app.db"
 
 
-@dataclass(frozen=True)
-class ChatMessage:
-    """A single chat message with strict role and content. Used for history and persistence."""
+class ChatMessage(NamedTuple):
+    """A single chat message with strict role and content. Used for history and persistence.
+    A NamedTuple rather than a dataclass: long histories build thousands of these and tuples are cheaper to create."""
     role: str
     content: str
     tool_result: str | None = None
@@ -40,7 +43,7 @@ CREATE TABLE IF NOT EXISTS chats (
     database_id INTEGER REFERENCES database_descriptions(id) ON DELETE CASCADE,
     database_name TEXT NOT NULL,
     title TEXT NOT NULL DEFAULT 'Новый чат',
-    created_at TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now')),
     starred INTEGER NOT NULL DEFAULT 0
 );
 
@@ -49,28 +52,119 @@ CREATE TABLE IF NOT EXISTS chat_messages (
     chat_id INTEGER NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
     role TEXT NOT NULL,
     content TEXT NOT NULL,
-    created_at TEXT NOT NULL
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%SZ', 'now'))
 );
 
-CREATE INDEX IF NOT EXISTS idx_chats_database_name ON chats(database_name);
+-- Entries are (chat_id, rowid) and id is the rowid, so WHERE chat_id = ? ORDER BY id is a plain range scan
 CREATE INDEX IF NOT EXISTS idx_chat_messages_chat_id ON chat_messages(chat_id);
 """
 
+# created_at is formatted by SQLite; spelled out in INSERTs because older DBs have no column default
+_NOW_SQL = "strftime('%Y-%m-%dT%H:%M:%SZ', 'now')"
+
 # Max length for one message content to avoid DB bloat from runaway model output
 MAX_MESSAGE_CONTENT_LENGTH = 200_000
+_CONTENT_TRUNCATED_SUFFIX = "\n\n[... message truncated due to size ...]"
+_RESULT_TRUNCATED_SUFFIX = "\n\n[... result truncated due to size ...]"
+
+# Descriptions change rarely but are read on every agent turn; cache them briefly in-process
+DESCRIPTION_CACHE_TTL = 30.0
+
+_description_cache: dict[str, tuple[float, str]] = {}
+
+
+# Applied to every connection; journal_mode=WAL is persistent and set once in init_db.
+# foreign_keys is per connection in SQLite and off by default; delete_chat relies on its ON DELETE CASCADE
+_CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+    # Read pages straight from the OS page cache instead of a pread() per page
+    "PRAGMA mmap_size=268435456",
+)
+
+
+# One long-lived connection per thread keeps SQLite's page cache warm and skips re-opening the files
+_local = threading.local()
+_open_connections: list[sqlite3.Connection] = []
+_open_connections_lock = threading.Lock()
 
 
+def _connect() -> sqlite3.Connection:
+    # Each connection is used by its own thread only; check_same_thread=False just lets shutdown close it
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
 
 def _get_conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """Return this thread's store connection (autocommit; writers go through _write_transaction). Never close it."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = _connect()
+        # Autocommit: the sqlite3 module must not open its own deferred transactions
+        conn.isolation_level = None
+        with _open_connections_lock:
+            _open_connections.append(conn)
     return conn
 
 
-def init_db() -> None:
-    """Create DB file and tables if they do not exist. Run migrations for existing DBs."""
+@contextmanager
+def _write_transaction():
+    """Run the block in a BEGIN IMMEDIATE transaction on this thread's connection; commit on success, else roll back.
+    Taking the write lock up front avoids a deferred transaction failing with SQLITE_BUSY when it upgrades mid-way."""
     conn = _get_conn()
+    conn.execute("BEGIN IMMEDIATE")
+    with conn:
+        yield conn
+
+
+def close_connections() -> None:
+    """Close every per-thread connection (call on shutdown)."""
+    with _open_connections_lock:
+        conns = list(_open_connections)
+        _open_connections.clear()
+    for conn in conns:
+        conn.close()
+
+
+# Stored in PRAGMA user_version once every migration below has run; bump it when adding a migration
+SCHEMA_VERSION = 1
+
+_init_lock = threading.Lock()
+_did_init = False
+
+
+def init_db() -> None:
+    """Create DB file and tables if they do not exist. Run migrations for existing DBs. Runs once per process."""
+    global _did_init
+    if _did_init:
+        return
+    with _init_lock:
+        if _did_init:
+            return
+        _init_db()
+        _did_init = True
+
+
+def _init_db() -> None:
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    conn = _connect()
     try:
+        # Up to date: WAL mode and the schema are persistent, nothing left to check
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            return
+
+        # page_size only takes effect on a database with no tables yet (and never once in WAL mode),
+        # so existing files keep their page size; new ones get 8 KiB pages
+        conn.execute("PRAGMA page_size=8192")
+        # WAL lets readers run alongside the writer; with synchronous=NORMAL commits skip the per-commit fsync
+        if str(DB_PATH) != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        # Migrations rebuild tables; with foreign keys on, DROP TABLE would cascade into chats
+        conn.execute("PRAGMA foreign_keys=OFF")
         conn.executescript(_SCHEMA)
         conn.commit()
 
@@ -115,10 +209,12 @@ def init_db() -> None:
                 "SELECT id FROM database_descriptions WHERE database_descriptions.name = chats.database_name"
                 ")"
             )
-            conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_database_id ON chats(database_id)")
             conn.commit()
 
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_database_id ON chats(database_id)")
+        # Chats are listed by database_id newest first; this index serves both the filter and the ORDER BY
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chats_db_id_created ON chats(database_id, created_at DESC)")
+        conn.execute("DROP INDEX IF EXISTS idx_chats_database_id")
+        conn.execute("DROP INDEX IF EXISTS idx_chats_database_name")
         conn.commit()
 
         # Migration: add tool_result, tool_call_id, tool_calls_json to chat_messages
@@ -147,6 +243,14 @@ def init_db() -> None:
             conn.execute("ALTER TABLE chat_messages ADD COLUMN completion_tokens INTEGER")
             conn.commit()
 
+        # Cleanup: messages left behind by deletes made before foreign keys were enforced
+        cur = conn.execute("DELETE FROM chat_messages WHERE chat_id NOT IN (SELECT id FROM chats)")
+        conn.commit()
+        if cur.rowcount:
+            log.info("Removed %d orphaned chat messages", cur.rowcount)
+
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
     finally:
         conn.close()
 
@@ -156,39 +260,70 @@ def init_db() -> None:
 # ---------------------------------------------------------------------------
 
 def get_db_description(name: str) -> str:
-    """Return description for a database by name. Empty string if not set."""
+    """Return description for a database by name. Empty string if not set. Cached for DESCRIPTION_CACHE_TTL."""
+    now = time.monotonic()
+    cached = _description_cache.get(name)
+    if cached and now - cached[0] < DESCRIPTION_CACHE_TTL:
+        return cached[1]
     with _get_conn() as conn:
         row = conn.execute(
             "SELECT description FROM database_descriptions WHERE name = ?",
             (name,),
         ).fetchone()
-        return row[0] if row else ""
+    description = row[0] if row else ""
+    _description_cache[name] = (now, description)
+    return description
+
+
+def get_db_descriptions(names: list[str]) -> dict[str, str]:
+    """Return descriptions for many databases, querying only names not fresh in the cache."""
+    now = time.monotonic()
+    result: dict[str, str] = {}
+    missing: list[str] = []
+    for name in names:
+        cached = _description_cache.get(name)
+        if cached and now - cached[0] < DESCRIPTION_CACHE_TTL:
+            result[name] = cached[1]
+        else:
+            missing.append(name)
+    if missing:
+        placeholders = ",".join("?" * len(missing))
+        with _get_conn() as conn:
+            rows = conn.execute(
+                f"SELECT name, description FROM database_descriptions WHERE name IN ({placeholders})",
+                missing,
+            ).fetchall()
+        found = {name: description or "" for name, description in rows}
+        for name in missing:
+            description = found.get(name, "")
+            _description_cache[name] = (now, description)
+            result[name] = description
+    return result
 
 
 def set_db_description(name: str, description: str) -> None:
     """Insert or replace description for a database."""
-    with _get_conn() as conn:
+    with _write_transaction() as conn:
         conn.execute(
             "INSERT INTO database_descriptions (name, description) VALUES (?, ?) "
             "ON CONFLICT(name) DO UPDATE SET description = excluded.description",
             (name, description or ""),
         )
-        conn.commit()
+    _description_cache.pop(name, None)
 
 
 def get_or_create_database_id(name: str) -> int:
     """Return database_descriptions.id for the given name; create row with empty description if missing."""
-    with _get_conn() as conn:
+    with _write_transaction() as conn:
         row = conn.execute(
             "SELECT id FROM database_descriptions WHERE name = ?", (name,)
         ).fetchone()
         if row:
-            return row["id"]
+            return row[0]
         cur = conn.execute(
             "INSERT INTO database_descriptions (name, description) VALUES (?, '')",
             (name,),
         )
-        conn.commit()
         return cur.lastrowid
 
 
@@ -200,112 +335,144 @@ def list_chats(database_name: str) -> list[dict]:
     """Return list of chats for the given database, starred first then newest first."""
     with _get_conn() as conn:
         rows = conn.execute(
-            "SELECT id, title, created_at, starred FROM chats WHERE database_name = ? "
+            "SELECT id, title, created_at, starred FROM chats "
+            "WHERE database_id = (SELECT id FROM database_descriptions WHERE name = ?) "
             "ORDER BY created_at DESC",
             (database_name,),
         ).fetchall()
-        return [
-            {
-                "id": r["id"],
-                "title": r["title"],
-                "created_at": r["created_at"],
-                "starred": bool(r["starred"]),
-            }
-            for r in rows
-        ]
+    return [
+        {"id": id_, "title": title, "created_at": created_at, "starred": bool(starred)}
+        for id_, title, created_at, starred in rows
+    ]
 
 
 def create_chat(database_name: str, title: str = "Новый чат") -> dict:
     """Create a new chat for the database. Returns {id, title, created_at, starred}."""
-    database_id = get_or_create_database_id(database_name)
-    now = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    with _get_conn() as conn:
-        cur = conn.execute(
-            "INSERT INTO chats (database_id, database_name, title, created_at, starred) VALUES (?, ?, ?, ?, 0)",
-            (database_id, database_name, title or "Новый чат", now),
+    title = title or "Новый чат"
+    # Description upsert and chat insert share one transaction (one commit instead of up to three)
+    with _write_transaction() as conn:
+        conn.execute(
+            "INSERT INTO database_descriptions (name, description) VALUES (?, '') ON CONFLICT(name) DO NOTHING",
+            (database_name,),
         )
-        conn.commit()
-        chat_id = cur.lastrowid
-    return {"id": chat_id, "title": title or "Новый чат", "created_at": now, "starred": False}
+        chat_id, created_at = conn.execute(
+            "INSERT INTO chats (database_id, database_name, title, created_at, starred) "
+            f"VALUES ((SELECT id FROM database_descriptions WHERE name = ?), ?, ?, {_NOW_SQL}, 0) "
+            "RETURNING id, created_at",
+            (database_name, database_name, title),
+        ).fetchone()
+    return {"id": chat_id, "title": title, "created_at": created_at, "starred": False}
+
+
+_MESSAGE_COLUMNS = (
+    "role, content, tool_result, tool_call_id, tool_calls_json, prompt_tokens, cached_tokens, completion_tokens"
+)
+
+
+def _chat_message(role, content, tool_result, tool_call_id, tool_calls_json,
+                  prompt_tokens, cached_tokens, completion_tokens) -> ChatMessage:
+    tool_calls = None
+    if tool_calls_json:
+        try:
+            tool_calls = orjson.loads(tool_calls_json)
+        except (orjson.JSONDecodeError, TypeError) as e:
+            log.error("Error loading tool_calls_json: %s, content: %s", e, tool_calls_json)
+    return ChatMessage(
+        role,
+        content or "",
+        tool_result or None,
+        tool_call_id or None,
+        tool_calls,
+        prompt_tokens,
+        cached_tokens,
+        completion_tokens,
+    )
 
 
 def get_chat_messages(chat_id: int) -> list[ChatMessage]:
     """Load all messages for a chat as list of ChatMessage."""
     with _get_conn() as conn:
-        rows = conn.execute("""
-            SELECT role, content, tool_result, tool_call_id, tool_calls_json, 
-                   prompt_tokens, cached_tokens, completion_tokens 
-            FROM chat_messages 
-            WHERE chat_id = ? 
-            ORDER BY id ASC
-            """,
+        rows = conn.execute(
+            f"SELECT {_MESSAGE_COLUMNS} FROM chat_messages WHERE chat_id = ? ORDER BY id ASC",
             (chat_id,),
         ).fetchall()
-        out = []
-        for r in rows:
-            tool_calls = None
-            tool_calls_json = r["tool_calls_json"]
-            if tool_calls_json:
-                try:
-                    tool_calls = json.loads(tool_calls_json)
-                except (json.JSONDecodeError, TypeError) as e:
-                    log.error("Error loading tool_calls_json: %s, content: %s", e, tool_calls_json)
-                    pass
-            out.append(
-                ChatMessage(
-                    role=r["role"],
-                    content=r["content"] or "",
-                    tool_result=r["tool_result"] if r["tool_result"] else None,
-                    tool_call_id=r["tool_call_id"] if r["tool_call_id"] else None,
-                    tool_calls=tool_calls,
-                    prompt_tokens=r["prompt_tokens"],
-                    cached_tokens=r["cached_tokens"],
-                    completion_tokens=r["completion_tokens"],
-                )
-            )
-        return out
+    return [_chat_message(*r) for r in rows]
+
+
+def count_chat_messages(chat_id: int) -> int:
+    """Return how many messages are stored for a chat (an index-only count)."""
+    with _get_conn() as conn:
+        return conn.execute("SELECT COUNT(*) FROM chat_messages WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+
+
+def load_chat(chat_id: int) -> tuple[str | None, list[ChatMessage]]:
+    """Return (database_name, messages) for a chat in one query; (None, []) if the chat does not exist."""
+    with _get_conn() as conn:
+        rows = conn.execute(
+            "SELECT c.database_name, m.role, m.content, m.tool_result, m.tool_call_id, m.tool_calls_json, "
+            "m.prompt_tokens, m.cached_tokens, m.completion_tokens "
+            "FROM chats c LEFT JOIN chat_messages m ON m.chat_id = c.id "
+            "WHERE c.id = ? ORDER BY m.id",
+            (chat_id,),
+        ).fetchall()
+    if not rows:
+        return None, []
+    # A chat without messages still yields one row, with NULL message columns
+    messages = [_chat_message(*r[1:]) for r in rows if r[1] is not None]
+    return rows[0][0], messages
+
+
+def _truncate(text: str, marker: str) -> str:
+    # The marker counts towards the limit, so truncating an already truncated text changes nothing
+    if len(text) > MAX_MESSAGE_CONTENT_LENGTH:
+        return text[:MAX_MESSAGE_CONTENT_LENGTH - len(marker)] + marker
+    return text
+
+
+def stored_message(msg: ChatMessage) -> ChatMessage:
+    """Return msg as the store keeps it: content stripped, content and tool_result cut to MAX_MESSAGE_CONTENT_LENGTH.
+    Idempotent; use the result for both persisting and in-memory history so a reload sees the same text."""
+    # str.strip() hands back the same object when there is nothing to trim, so no copy in the common case
+    content = _truncate((msg.content or "").strip(), _CONTENT_TRUNCATED_SUFFIX)
+    tool_result = _truncate(msg.tool_result, _RESULT_TRUNCATED_SUFFIX) if msg.tool_result else None
+    if content is msg.content and tool_result is msg.tool_result:
+        return msg
+    return msg._replace(content=content, tool_result=tool_result)
+
+
+def _message_row(chat_id: int, msg: ChatMessage) -> tuple:
+    msg = stored_message(msg)
+    tool_calls_json = None
+    if msg.tool_calls:
+        try:
+            tool_calls_json = orjson.dumps(msg.tool_calls).decode()
+        except (TypeError, ValueError):
+            pass
+    return (
+        chat_id,
+        msg.role,
+        msg.content,
+        msg.tool_result,
+        msg.tool_call_id or None,
+        tool_calls_json,
+        msg.prompt_tokens,
+        msg.cached_tokens,
+        msg.completion_tokens,
+    )
 
 
 def append_chat_messages(chat_id: int, messages: list[ChatMessage]) -> None:
-    """Append messages to a chat. Content and tool_result are truncated to MAX_MESSAGE_CONTENT_LENGTH."""
+    """Append messages to a chat in one transaction. Content and tool_result are truncated to MAX_MESSAGE_CONTENT_LENGTH."""
     if not messages:
         return
-    now = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-    with _get_conn() as conn:
-        for msg in messages:
-            content = (msg.content or "").strip()
-            if len(content) > MAX_MESSAGE_CONTENT_LENGTH:
-                content = content[:MAX_MESSAGE_CONTENT_LENGTH] + "\n\n[... message truncated due to size ...]"
-            tool_result = getattr(msg, "tool_result", None) or None
-            if tool_result and len(tool_result) > MAX_MESSAGE_CONTENT_LENGTH:
-                tool_result = tool_result[:MAX_MESSAGE_CONTENT_LENGTH] + "\n\n[... result truncated due to size ...]"
-            tool_call_id = getattr(msg, "tool_call_id", None) or None
-            tool_calls_json = None
-            if getattr(msg, "tool_calls", None):
-                try:
-                    tool_calls_json = json.dumps(msg.tool_calls)
-                except (TypeError, ValueError):
-                    pass
-            pt = getattr(msg, "prompt_tokens", None)
-            ct_cached = getattr(msg, "cached_tokens", None)
-            ct_comp = getattr(msg, "completion_tokens", None)
-            conn.execute(
-                "INSERT INTO chat_messages (chat_id, role, content, created_at, tool_result, tool_call_id, tool_calls_json, "
-                "prompt_tokens, cached_tokens, completion_tokens) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                (
-                    chat_id,
-                    msg.role,
-                    content,
-                    now,
-                    tool_result,
-                    tool_call_id,
-                    tool_calls_json,
-                    pt,
-                    ct_cached,
-                    ct_comp,
-                ),
-            )
-        conn.commit()
+    rows = [_message_row(chat_id, msg) for msg in messages]
+    with _write_transaction() as conn:
+        conn.executemany(
+            "INSERT INTO chat_messages (chat_id, role, content, created_at, tool_result, tool_call_id, tool_calls_json, "
+            "prompt_tokens, cached_tokens, completion_tokens) "
+            f"VALUES (?, ?, ?, {_NOW_SQL}, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
 
 
 def get_chat_token_stats(chat_id: int) -> dict:
@@ -320,20 +487,19 @@ def get_chat_token_stats(chat_id: int) -> dict:
             "COALESCE((SELECT SUM(completion_tokens) FROM chat_messages WHERE chat_id = ?), 0) AS total_completion_tokens",
             (chat_id, chat_id, chat_id, chat_id),
         ).fetchone()
-    last_p = row["last_prompt_tokens"]
+    last_p, total_p, total_cached, total_completion = row
     return {
         "last_prompt_tokens": int(last_p) if last_p is not None else 0,
-        "total_prompt_tokens": int(row["total_prompt_tokens"] or 0),
-        "total_cached_tokens": int(row["total_cached_tokens"] or 0),
-        "total_completion_tokens": int(row["total_completion_tokens"] or 0),
+        "total_prompt_tokens": int(total_p or 0),
+        "total_cached_tokens": int(total_cached or 0),
+        "total_completion_tokens": int(total_completion or 0),
     }
 
 
 def update_chat_title(chat_id: int, title: str) -> None:
     """Update chat title (e.g. after first user message)."""
-    with _get_conn() as conn:
+    with _write_transaction() as conn:
         conn.execute("UPDATE chats SET title = ? WHERE id = ?", (title, chat_id))
-        conn.commit()
 
 
 def get_chat_database_name(chat_id: int) -> str | None:
@@ -342,35 +508,29 @@ def get_chat_database_name(chat_id: int) -> str | None:
         row = conn.execute(
             "SELECT database_name FROM chats WHERE id = ?", (chat_id,)
         ).fetchone()
-        return row["database_name"] if row else None
+        return row[0] if row else None
 
 
 def set_chat_starred(chat_id: int, starred: bool) -> None:
     """Set or unset the starred flag for a chat."""
-    with _get_conn() as conn:
+    with _write_transaction() as conn:
         conn.execute(
             "UPDATE chats SET starred = ? WHERE id = ?",
             (1 if starred else 0, chat_id),
         )
-        conn.commit()
 
 
 def delete_chat(chat_id: int) -> None:
     """Delete a chat and its messages (CASCADE)."""
-    with _get_conn() as conn:
+    with _write_transaction() as conn:
         conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
-        conn.commit()
 
 
 def fix_oversized_message_contents(max_length: int = MAX_MESSAGE_CONTENT_LENGTH) -> int:
     """Replace oversized message content with truncated version. Returns number of rows updated."""
-    with _get_conn() as conn:
-        rows = conn.execute(
-            "SELECT id, content FROM chat_messages WHERE length(content) > ?",
-            (max_length,),
-        ).fetchall()
-        for row in rows:
-            new_content = row["content"][:max_length] + "\n\n[... сообщение обрезано из-за большого объёма ...]"
-            conn.execute("UPDATE chat_messages SET content = ? WHERE id = ?", (new_content, row["id"]))
-        conn.commit()
-        return len(rows)
+    with _write_transaction() as conn:
+        cur = conn.execute(
+            "UPDATE chat_messages SET content = substr(content, 1, ?) || ? WHERE length(content) > ?",
+            (max_length, "\n\n[... сообщение обрезано из-за большого объёма ...]", max_length),
+        )
+        return cur.rowcount
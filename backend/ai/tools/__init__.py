@@ -1,5 +1,6 @@
 import yaml
 
+from .describe_table import definition as describe_table_def, describe_table
 from .execute_read_query import definition as execute_read_query_def, execute_read_query
 from .get_current_utc_time import definition as get_current_utc_time_def, get_current_utc_time
 from .get_database_info import definition as get_database_info_def, get_database_info
@@ -13,11 +14,13 @@ from .get_table_type_definition import definition as get_table_type_definition_d
 from .list_sql_modules import definition as list_sql_modules_def, list_sql_modules
 from .list_tables import definition as list_tables_def, list_tables
 
-TOOL_DEFINITIONS = [
+# Immutable: passed unchanged to every LLM round
+TOOL_DEFINITIONS = (
     get_current_utc_time_def,
     get_database_info_def,
     list_tables_def,
     get_table_structure_def,
+    describe_table_def,
     get_table_type_definition_def,
     get_indexes_def,
     get_execution_plan_def,
@@ -26,31 +29,49 @@ TOOL_DEFINITIONS = [
     get_object_definition_def,
     list_sql_modules_def,
     execute_read_query_def,
-]
-
-
-def dispatch_tool(name: str, args: dict, database: str) -> str:
-    """Route a tool call to the appropriate function."""
-    handlers = {
-        "get_current_utc_time": lambda a: get_current_utc_time(),
-        "get_database_info": lambda a: get_database_info(database),
-        "list_tables": lambda a: list_tables(database),
-        "get_table_structure": lambda a: get_table_structure(database, a["table_name"], a.get("schema", "dbo")),
-        "get_table_type_definition": lambda a: get_table_type_definition(database, a["table_type_name"], a.get("schema", "dbo")),
-        "get_indexes": lambda a: get_indexes(database, a["table_name"], a.get("schema", "dbo")),
-        "get_execution_plan": lambda a: get_execution_plan(database, a["query"]),
-        "get_missing_indexes": lambda a: get_missing_indexes(database, a.get("table_name"), a.get("schema", "dbo")),
-        "get_foreign_keys": lambda a: get_foreign_keys(database, a["table_name"], a.get("schema", "dbo")),
-        "get_object_definition": lambda a: get_object_definition(database, a["object_name"], a.get("schema", "dbo")),
-        "list_sql_modules": lambda a: list_sql_modules(database, a["object_type"]),
-        "execute_read_query": lambda a: execute_read_query(database, a["query"]),
-    }
-
-    handler = handlers.get(name)
-    if not handler:
+)
+
+
+# Placeholders in an argument spec for values that do not come from the model's arguments
+_DATABASE = object()
+_MAX_CHARS = object()
+
+_DBO = ("schema", "dbo")
+
+# Tool name -> (function, argument spec). Each spec item is _DATABASE, _MAX_CHARS,
+# a required argument name, or an (argument name, default) pair; items are passed positionally.
+_DISPATCH = {
+    "get_current_utc_time": (get_current_utc_time, ()),
+    "get_database_info": (get_database_info, (_DATABASE,)),
+    "list_tables": (list_tables, (_DATABASE,)),
+    "get_table_structure": (get_table_structure, (_DATABASE, "table_name", _DBO)),
+    "describe_table": (describe_table, (_DATABASE, "table_name", _DBO)),
+    "get_table_type_definition": (get_table_type_definition, (_DATABASE, "table_type_name", _DBO)),
+    "get_indexes": (get_indexes, (_DATABASE, "table_name", _DBO)),
+    "get_execution_plan": (get_execution_plan, (_DATABASE, "query")),
+    "get_missing_indexes": (get_missing_indexes, (_DATABASE, ("table_name", None), _DBO)),
+    "get_foreign_keys": (get_foreign_keys, (_DATABASE, "table_name", _DBO)),
+    "get_object_definition": (get_object_definition, (_DATABASE, "object_name", _DBO)),
+    "list_sql_modules": (list_sql_modules, (_DATABASE, "object_type")),
+    "execute_read_query": (execute_read_query, (_DATABASE, "query", _MAX_CHARS)),
+}
+
+
+def dispatch_tool(name: str, args: dict, database: str, max_chars: int | None = None) -> str:
+    """Route a tool call to the appropriate function. max_chars lets row-returning tools stop reading early."""
+    entry = _DISPATCH.get(name)
+    if entry is None:
         return yaml.dump({"error": f"Unknown tool: {name}"}, allow_unicode=True)
+    fn, spec = entry
 
     try:
-        return handler(args)
+        call_args = [
+            database if item is _DATABASE
+            else max_chars if item is _MAX_CHARS
+            else args[item] if isinstance(item, str)
+            else args.get(*item)
+            for item in spec
+        ]
+        return fn(*call_args)
     except Exception as e:
         return yaml.dump({"error": str(e)}, allow_unicode=True)
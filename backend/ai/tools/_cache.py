@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+# Schema metadata barely changes during a conversation, but the model asks for it again and again
+SCHEMA_CACHE_TTL = 60.0
+
+# Missing-index DMVs accumulate with every query the server runs, so their snapshot ages faster
+DMV_CACHE_TTL = 15.0
+
+# Per-function bound on cached argument combinations; least recently used entries go first
+MAX_CACHE_ENTRIES = 512
+
+
+def ttl_cache(ttl: float, key=None):
+    """Cache a tool's result per argument tuple for ttl seconds (LRU-bounded, thread-safe).
+    key, if given, builds the cache key from the call's arguments instead.
+    Exceptions are not cached. The wrapper gets cache_clear()."""
+    def decorator(fn):
+        entries: OrderedDict[tuple, tuple[float, str]] = OrderedDict()
+        lock = threading.Lock()
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if key is not None:
+                entry_key = key(*args, **kwargs)
+            else:
+                entry_key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+            now = time.monotonic()
+            with lock:
+                hit = entries.get(entry_key)
+                if hit is not None and now - hit[0] < ttl:
+                    entries.move_to_end(entry_key)
+                    return hit[1]
+            value = fn(*args, **kwargs)
+            with lock:
+                entries[entry_key] = (now, value)
+                entries.move_to_end(entry_key)
+                while len(entries) > MAX_CACHE_ENTRIES:
+                    entries.popitem(last=False)
+            return value
+
+        def cache_clear() -> None:
+            with lock:
+                entries.clear()
+
+        wrapper.cache_clear = cache_clear
+        return wrapper
+    return decorator
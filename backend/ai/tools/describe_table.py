@@ -0,0 +1,58 @@
+import yaml
+
+from backend.mssql_db import query_result_sets
+
+from ._cache import DMV_CACHE_TTL, ttl_cache
+from ._columns_sql import COLUMNS_SQL
+from .get_foreign_keys import FOREIGN_KEYS_SQL
+from .get_indexes import INDEXES_SQL
+from .get_missing_indexes import MISSING_INDEXES_ORDER_BY, MISSING_INDEXES_SQL, MISSING_INDEXES_TABLE_FILTER
+from .get_table_structure import TABLE_STATS_SQL, table_structure_summary
+
+# The per-table tools' queries as one batch: a single round trip returning five result sets in this order
+DESCRIBE_TABLE_SQL = (
+    "set nocount on;\n"
+    "declare @object_id int = object_id(quotename(?) + '.' + quotename(?));\n"
+    + COLUMNS_SQL.replace("c.object_id = ?", "c.object_id = @object_id") + ";\n"
+    + TABLE_STATS_SQL + ";\n"
+    + INDEXES_SQL + "\n"
+    + FOREIGN_KEYS_SQL + ";\n"
+    + MISSING_INDEXES_SQL + MISSING_INDEXES_TABLE_FILTER + MISSING_INDEXES_ORDER_BY + ";"
+)
+
+
+# Includes the missing-index DMVs, so it ages as fast as get_missing_indexes
+@ttl_cache(DMV_CACHE_TTL)
+def describe_table(database: str, table_name: str, schema: str = "dbo") -> str:
+    params = (
+        schema, table_name,                          # @object_id
+        schema, table_name,                          # stats
+        schema, table_name,                          # indexes
+        schema, table_name, schema, table_name,      # foreign keys
+        table_name, schema,                          # missing indexes
+    )
+    columns, stats, indexes, foreign_keys, missing_indexes = query_result_sets(database, DESCRIBE_TABLE_SQL, params)
+    combined = {
+        **table_structure_summary(columns, stats),
+        "indexes": indexes,
+        "foreign_keys": foreign_keys,
+        "missing_indexes": missing_indexes,
+    }
+    return yaml.dump(combined, allow_unicode=True)
+
+
+definition = {
+    "type": "function",
+    "function": {
+        "name": "describe_table",
+        "description": "Get everything about one table in a single call: column definitions, summary stats (row count, data size, index count and size, data space), all indexes, foreign keys in both directions, and missing index recommendations. Prefer this over calling get_table_structure, get_indexes, get_foreign_keys and get_missing_indexes one by one for the same table.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "table_name": {"type": "string", "description": "Table name"},
+                "schema": {"type": "string", "description": "Schema name (default: dbo)", "default": "dbo"},
+            },
+            "required": ["table_name"],
+        },
+    },
+}
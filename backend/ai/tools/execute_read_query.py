@@ -1,26 +1,116 @@
+import hashlib
 import re
+from typing import NamedTuple
 
 import yaml
 
 from backend.mssql_db import MAX_ROWS, execute_query
 
+from ._cache import ttl_cache
 
-def execute_read_query(database: str, query: str) -> str:
-    normalized = re.sub(r"--[^\n]*", "", query)
-    normalized = re.sub(r"/\*.*?\*/", "", normalized, flags=re.DOTALL)
-    normalized = normalized.strip().upper()
+# The model often re-asks the exact same SELECT within a turn; short, since user tables may be changing
+QUERY_CACHE_TTL = 10.0
 
-    if not normalized.startswith("SELECT") and not normalized.startswith("WITH"):
-        return yaml.dump({"error": "Only SELECT queries are allowed"}, allow_unicode=True)
 
-    forbidden = ["INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE",
-                 "TRUNCATE", "EXEC", "EXECUTE", "MERGE", "GRANT", "REVOKE"]
-    tokens = re.findall(r'\b[A-Z]+\b', normalized)
-    for token in tokens:
-        if token in forbidden:
-            return yaml.dump({"error": f"Forbidden keyword: {token}"}, allow_unicode=True)
+# One alternation over the raw query: comments, string literals and quoted identifiers are matched
+# (and skipped) as whole tokens, so keywords inside them never count. Unterminated ones run to the end;
+# SQL Server rejects such a batch anyway. Numbers are tokens of their own because T-SQL ends a numeric
+# literal at the first letter that cannot continue it: "1DELETE" is 1 followed by DELETE.
+_TOKEN = re.compile(
+    r"""
+      (?P<comment> --[^\n]* | /\*.*?(?:\*/|\Z) )
+    | (?P<quoted> '(?:[^']|'')*'? | \[(?:[^\]]|\]\])*\]? | "(?:[^"]|"")*"? )
+    | (?P<number> 0[xX][0-9a-fA-F]* | \d+(?:\.\d*)?(?:[eE][+-]?\d+)? )
+    | (?P<word> [\w@#$]+ )
+    """,
+    re.DOTALL | re.VERBOSE,
+)
 
-    return execute_query(database, query)
+_WHITESPACE = re.compile(r"\s+")
+
+_ALLOWED_FIRST_WORDS = frozenset({"SELECT", "WITH"})
+
+# SQL Server stops every SELECT in the batch after this many rows, so a huge result is never produced or
+# drained over the network; the extra row lets rows_to_yaml tell that the output was truncated.
+# Reset at the end because the setting lives on the (pooled) session.
+_ROW_LIMITED_BATCH = "SET ROWCOUNT {limit};\n{query}\n;SET ROWCOUNT 0;"
+
+_FORBIDDEN = frozenset({
+    "INSERT", "UPDATE", "DELETE", "DROP", "ALTER", "CREATE",
+    "TRUNCATE", "EXEC", "EXECUTE", "MERGE", "GRANT", "REVOKE",
+})
+
+# A query calling any of these answers differently on every run, so its result is never cached
+_NONDETERMINISTIC = frozenset({
+    "GETDATE", "GETUTCDATE", "SYSDATETIME", "SYSUTCDATETIME", "SYSDATETIMEOFFSET",
+    "CURRENT_TIMESTAMP", "NEWID", "NEWSEQUENTIALID", "RAND", "CRYPT_GEN_RANDOM",
+})
+
+
+class _ScannedQuery(NamedTuple):
+    error: str | None
+    # The query with comments dropped and whitespace between tokens collapsed to one space
+    canonical: str = ""
+    # False when the result must not be served from the cache
+    cacheable: bool = True
+
+
+def _scan_query(query: str) -> _ScannedQuery:
+    """Check that query is an allowed read-only statement and canonicalize it. Single forward scan of the text."""
+    pos = 0
+    leading = True
+    cacheable = True
+    gap = []  # text since the last code token, comments replaced by a space
+    code = []
+    for m in _TOKEN.finditer(query):
+        gap.append(query[pos:m.start()])
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == "comment":
+            # Dropping an unterminated /* would make a batch the server rejects look like a valid cached one
+            text = m.group()
+            if text.startswith("/*") and (len(text) < 4 or not text.endswith("*/")):
+                cacheable = False
+            gap.append(" ")
+            continue
+        if leading:
+            # The first code token must be SELECT/WITH with only whitespace and comments before it
+            if kind != "word" or "".join(gap).strip() or m.group().upper() not in _ALLOWED_FIRST_WORDS:
+                return _ScannedQuery("Only SELECT queries are allowed")
+            leading = False
+            gap.clear()
+        elif kind == "word":
+            word = m.group().upper()
+            if word in _FORBIDDEN:
+                return _ScannedQuery(f"Forbidden keyword: {word}")
+            if word in _NONDETERMINISTIC:
+                cacheable = False
+        if gap:
+            code.append(_WHITESPACE.sub(" ", "".join(gap)))
+            gap.clear()
+        code.append(m.group())
+    if leading:
+        return _ScannedQuery("Only SELECT queries are allowed")
+    code.append(query[pos:].rstrip())
+    return _ScannedQuery(None, "".join(code), cacheable)
+
+
+@ttl_cache(QUERY_CACHE_TTL, key=lambda database, digest, batch, max_chars: (database, digest, max_chars))
+def _execute_cached(database: str, digest: bytes, batch: str, max_chars: int | None) -> str:
+    return execute_query(database, batch, max_chars=max_chars)
+
+
+def execute_read_query(database: str, query: str, max_chars: int | None = None) -> str:
+    scanned = _scan_query(query)
+    if scanned.error is not None:
+        return yaml.dump({"error": scanned.error}, allow_unicode=True)
+
+    limited = _ROW_LIMITED_BATCH.format(limit=MAX_ROWS + 1, query=query)
+    if not scanned.cacheable:
+        return execute_query(database, limited, max_chars=max_chars)
+    # Keyed on a digest so the cache holds 16 bytes per query rather than its text
+    digest = hashlib.blake2b(scanned.canonical.encode(), digest_size=16).digest()
+    return _execute_cached(database, digest, limited, max_chars)
 
 
 definition = {
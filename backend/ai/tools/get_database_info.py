@@ -1,8 +1,9 @@
 from backend.mssql_db import execute_query
 
+from ._cache import SCHEMA_CACHE_TTL, ttl_cache
 
-def get_database_info(database: str) -> str:
-    sql = """
+
+DATABASE_INFO_SQL = """
         with db_sizes
         as (
             select
@@ -65,7 +66,11 @@ def get_database_info(database: str) -> str:
             cross join db_sizes s
         where d.database_id = db_id()
     """
-    return execute_query(database, sql)
+
+
+@ttl_cache(SCHEMA_CACHE_TTL)
+def get_database_info(database: str) -> str:
+    return execute_query(database, DATABASE_INFO_SQL)
 
 
 definition = {
@@ -1,84 +1,152 @@
-import xml.etree.ElementTree as ET
+import io
+import sys
+from functools import lru_cache
+
+from lxml import etree
 
 import yaml
 
 from backend.mssql_db import get_connection
 
+_NS = {"sp": "http://schemas.microsoft.com/sqlserver/2004/07/showplan"}
 
-def _parse_execution_plan(xml_plan: str) -> str:
-    """Parse SHOWPLAN_XML into a readable summary."""
-    ns = {"sp": "http://schemas.microsoft.com/sqlserver/2004/07/showplan"}
-    try:
-        root = ET.fromstring(xml_plan)
-    except ET.ParseError:
-        return yaml.dump({"raw_plan": xml_plan[:4000]}, allow_unicode=True)
+# Compiled once so libxml2 evaluates it in C on every call
+_XP_MISSING_INDEXES = etree.XPath(".//sp:MissingIndex", namespaces=_NS)
 
-    statements = []
-    for stmt in root.findall(".//sp:StmtSimple", ns):
-        stmt_text = stmt.get("StatementText", "")
-        est_rows = stmt.get("StatementEstRows", "")
-        est_cost = stmt.get("StatementSubTreeCost", "")
+_intern = sys.intern
+
+_NO_PLAN_ERROR = yaml.dump({"error": "No execution plan returned"}, allow_unicode=True)
 
-        operators = []
-        for rel_op in stmt.findall(".//sp:RelOp", ns):
+_NS_PREFIX = f"{{{_NS['sp']}}}"
+_NS_PREFIX_LEN = len(_NS_PREFIX)
+
+_STMT_TAG = f"{{{_NS['sp']}}}StmtSimple"
+_MISSING_INDEX_GROUP_TAG = f"{{{_NS['sp']}}}MissingIndexGroup"
+_REL_OP_TAG = f"{{{_NS['sp']}}}RelOp"
+_OBJECT_TAG = f"{{{_NS['sp']}}}Object"
+_WARNINGS_TAG = f"{{{_NS['sp']}}}Warnings"
+_COLUMN_GROUP_TAG = f"{{{_NS['sp']}}}ColumnGroup"
+_COLUMN_TAG = f"{{{_NS['sp']}}}Column"
+_WALK_TAGS = (_STMT_TAG, _REL_OP_TAG, _OBJECT_TAG, _WARNINGS_TAG)
+
+
+@lru_cache(maxsize=4096)
+def _unbracket(name: str) -> str:
+    """Unquote a [bracketed] identifier. Cached: plans repeat the same few names across many operators."""
+    if name.startswith("[") and name.endswith("]"):
+        return name[1:-1].replace("]]", "]")
+    return name
+
+
+def _statement_summaries(top) -> list[dict]:
+    """Summarize a top-level statement and the statements nested in it, in one walk over its subtree.
+    RelOps belong to their innermost statement; Object and Warnings to their nearest enclosing RelOp."""
+    statements = []
+    open_statements = []  # operator lists of the statements being walked, innermost last
+    open_ops = []
+    for event, elem in etree.iterwalk(top, events=("start", "end"), tag=_WALK_TAGS):
+        tag = elem.tag
+        if event == "end":
+            if tag == _REL_OP_TAG:
+                open_ops.pop()
+            elif tag == _STMT_TAG:
+                open_statements.pop()
+            continue
+
+        if tag == _REL_OP_TAG:
             op_info = {
-                "operation": rel_op.get("PhysicalOp", ""),
-                "logical_op": rel_op.get("LogicalOp", ""),
-                "est_rows": rel_op.get("EstimateRows", ""),
-                "est_cost": rel_op.get("EstimatedTotalSubtreeCost", ""),
-                "est_cpu": rel_op.get("EstimateCPU", ""),
-                "est_io": rel_op.get("EstimateIO", ""),
+                # Operator names repeat across hundreds of RelOps; interning keeps one copy of each
+                "operation": _intern(elem.get("PhysicalOp", "")),
+                "logical_op": _intern(elem.get("LogicalOp", "")),
+                "est_rows": elem.get("EstimateRows", ""),
+                "est_cost": elem.get("EstimatedTotalSubtreeCost", ""),
+                "est_cpu": elem.get("EstimateCPU", ""),
+                "est_io": elem.get("EstimateIO", ""),
             }
-            for obj in rel_op.findall(".//sp:Object", ns):
-                op_info["table"] = obj.get("Table", "").strip("[]")
-                op_info["index"] = obj.get("Index", "").strip("[]")
-                op_info["schema"] = obj.get("Schema", "").strip("[]")
-
-            for warn in rel_op.findall(".//sp:Warnings", ns):
-                warnings = []
-                for child in warn:
-                    tag = child.tag.replace(f"{{{ns['sp']}}}", "")
-                    warnings.append(tag)
-                if warnings:
-                    op_info["warnings"] = warnings
-
-            operators.append(op_info)
-
-        statements.append({
-            "statement": stmt_text.strip()[:200],
-            "estimated_rows": est_rows,
-            "estimated_cost": est_cost,
-            "operators": operators,
-        })
+            if open_statements:
+                open_statements[-1].append(op_info)
+            open_ops.append(op_info)
+        elif tag == _STMT_TAG:
+            operators = []
+            statements.append({
+                "statement": elem.get("StatementText", "").strip()[:200],
+                "estimated_rows": elem.get("StatementEstRows", ""),
+                "estimated_cost": elem.get("StatementSubTreeCost", ""),
+                "operators": operators,
+            })
+            open_statements.append(operators)
+        elif not open_ops:
+            continue
+        elif tag == _OBJECT_TAG:
+            op_info = open_ops[-1]
+            op_info["table"] = _unbracket(elem.get("Table", ""))
+            op_info["index"] = _unbracket(elem.get("Index", ""))
+            op_info["schema"] = _unbracket(elem.get("Schema", ""))
+        else:
+            warnings = [
+                tag[_NS_PREFIX_LEN:] if tag.startswith(_NS_PREFIX) else tag
+                for tag in (child.tag for child in elem.iterchildren(tag=etree.Element))
+            ]
+            if warnings:
+                open_ops[-1]["warnings"] = warnings
+
+    return statements
+
+
+def _missing_index_summaries(mg) -> list[dict]:
+    impact = mg.get("Impact", "")
+    out = []
+    for mi in _XP_MISSING_INDEXES(mg):
+        table = _unbracket(mi.get("Table", ""))
+        schema = _unbracket(mi.get("Schema", ""))
+        columns = {"EQUALITY": [], "INEQUALITY": [], "INCLUDE": []}
+        for cg in mi.iterchildren(_COLUMN_GROUP_TAG):
+            usage_columns = columns.get(cg.get("Usage"))
+            if usage_columns is not None:
+                usage_columns.extend(_unbracket(c.get("Name", "")) for c in cg.iterchildren(_COLUMN_TAG))
+        summary = {"table": f"{schema}.{table}", "impact": impact}
+        # Empty column groups are left out rather than dumped as null: fewer tokens for the model
+        if columns["EQUALITY"]:
+            summary["equality_columns"] = columns["EQUALITY"]
+        if columns["INEQUALITY"]:
+            summary["inequality_columns"] = columns["INEQUALITY"]
+        if columns["INCLUDE"]:
+            summary["include_columns"] = columns["INCLUDE"]
+        out.append(summary)
+    return out
+
 
+def _parse_execution_plan(xml_plan: str) -> str:
+    """Parse SHOWPLAN_XML into a readable summary.
+    Streams the plan: each top-level statement is summarized when it closes and then freed."""
+    statements = []
     missing_indexes = []
-    for mg in root.findall(".//sp:MissingIndexGroup", ns):
-        impact = mg.get("Impact", "")
-        for mi in mg.findall(".//sp:MissingIndex", ns):
-            table = mi.get("Table", "").strip("[]")
-            schema = mi.get("Schema", "").strip("[]")
-            eq_cols = [
-                c.get("Name", "").strip("[]")
-                for cg in mi.findall("sp:ColumnGroup[@Usage='EQUALITY']", ns)
-                for c in cg.findall("sp:Column", ns)
-            ]
-            inequality_columns = [
-                c.get("Name", "").strip("[]")
-                for cg in mi.findall("sp:ColumnGroup[@Usage='INEQUALITY']", ns)
-                for c in cg.findall("sp:Column", ns)
-            ]
-            incl_cols = [
-                c.get("Name", "").strip("[]")
-                for cg in mi.findall("sp:ColumnGroup[@Usage='INCLUDE']", ns)
-                for c in cg.findall("sp:Column", ns)
-            ]
-            missing_indexes.append({
-                "table": f"{schema}.{table}",
-                "impact": impact,
-                "equality_columns": eq_cols or None,
-                "inequality_columns": inequality_columns or None,
-                "include_columns": incl_cols or None,
-            })
+    # The plan is decoded text already; parse its UTF-8 bytes whatever encoding the declaration names.
+    # huge_tree lifts libxml2's depth limit, which deeply nested RelOp trees can hit.
+    events = etree.iterparse(
+        io.BytesIO(xml_plan.encode("utf-8")),
+        events=("end",),
+        tag=(_STMT_TAG, _MISSING_INDEX_GROUP_TAG),
+        encoding="utf-8",
+        huge_tree=True,
+        resolve_entities=False,
+        no_network=True,
+    )
+    try:
+        for _, elem in events:
+            if elem.tag == _MISSING_INDEX_GROUP_TAG:
+                missing_indexes.extend(_missing_index_summaries(elem))
+                elem.clear()
+                continue
+            # Statements nested in another one (procedure calls) are summarized with it, in document order
+            if next(elem.iterancestors(_STMT_TAG), None) is not None:
+                continue
+            statements.extend(_statement_summaries(elem))
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    except etree.XMLSyntaxError:
+        return yaml.dump({"raw_plan": xml_plan[:4000]}, allow_unicode=True)
 
     result = {"statements": statements}
     if missing_indexes:
@@ -89,15 +157,19 @@ def _parse_execution_plan(xml_plan: str) -> str:
 
 def get_execution_plan(database: str, query: str) -> str:
     """Get estimated execution plan and return a text summary."""
+    # SET SHOWPLAN_XML must be the only statement in its batch, so it cannot share a round trip with
+    # the query. Turning it off again is required: the session goes back to the connection pool.
     with get_connection(database) as conn:
         cursor = conn.cursor()
         cursor.execute("SET SHOWPLAN_XML ON")
-        cursor.execute(query)
-        row = cursor.fetchone()
-        cursor.execute("SET SHOWPLAN_XML OFF")
+        try:
+            cursor.execute(query)
+            row = cursor.fetchone()
+        finally:
+            cursor.execute("SET SHOWPLAN_XML OFF")
 
     if not row:
-        return yaml.dump({"error": "No execution plan returned"}, allow_unicode=True)
+        return _NO_PLAN_ERROR
 
     xml_plan = row[0]
     return _parse_execution_plan(xml_plan)
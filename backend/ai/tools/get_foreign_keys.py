@@ -1,8 +1,9 @@
 from backend.mssql_db import execute_query
 
+from ._cache import SCHEMA_CACHE_TTL, ttl_cache
 
-def get_foreign_keys(database: str, table_name: str, schema: str = "dbo") -> str:
-    sql = """
+
+FOREIGN_KEYS_SQL = """
         SELECT
             fk.name AS fk_name,
             tp.name AS parent_table,
@@ -25,7 +26,11 @@ def get_foreign_keys(database: str, table_name: str, schema: str = "dbo") -> str
            OR (sr.name = ? AND tr.name = ?)
         ORDER BY fk.name
     """
-    return execute_query(database, sql, (schema, table_name, schema, table_name))
+
+
+@ttl_cache(SCHEMA_CACHE_TTL)
+def get_foreign_keys(database: str, table_name: str, schema: str = "dbo") -> str:
+    return execute_query(database, FOREIGN_KEYS_SQL, (schema, table_name, schema, table_name))
 
 
 definition = {
@@ -1,8 +1,9 @@
 from backend.mssql_db import execute_query
 
+from ._cache import SCHEMA_CACHE_TTL, ttl_cache
 
-def get_indexes(database: str, table_name: str, schema: str = "dbo") -> str:
-    sql = """
+
+INDEXES_SQL = """
         select
           i.name as index_name
         , i.type_desc as index_type
@@ -104,7 +105,11 @@ def get_indexes(database: str, table_name: str, schema: str = "dbo") -> str:
         order by i.is_primary_key desc
                , i.name;
     """
-    return execute_query(database, sql, (schema, table_name))
+
+
+@ttl_cache(SCHEMA_CACHE_TTL)
+def get_indexes(database: str, table_name: str, schema: str = "dbo") -> str:
+    return execute_query(database, INDEXES_SQL, (schema, table_name))
 
 
 definition = {
@@ -1,8 +1,9 @@
 from backend.mssql_db import execute_query
 
+from ._cache import DMV_CACHE_TTL, ttl_cache
 
-def get_missing_indexes(database: str, table_name: str | None = None, schema: str = "dbo") -> str:
-    sql = """
+
+MISSING_INDEXES_SQL = """
         SELECT
             s.name AS schema_name,
             OBJECT_NAME(mid.object_id) AS table_name,
@@ -19,12 +20,20 @@ def get_missing_indexes(database: str, table_name: str | None = None, schema: st
         JOIN sys.schemas s ON mid.object_id = OBJECT_ID(QUOTENAME(s.name) + '.' + QUOTENAME(OBJECT_NAME(mid.object_id)))
         WHERE mid.database_id = DB_ID()
     """
+
+MISSING_INDEXES_TABLE_FILTER = " AND OBJECT_NAME(mid.object_id) = ? AND s.name = ?"
+MISSING_INDEXES_ORDER_BY = " ORDER BY migs.avg_user_impact * (migs.user_seeks + migs.user_scans) DESC"
+
+
+@ttl_cache(DMV_CACHE_TTL)
+def get_missing_indexes(database: str, table_name: str | None = None, schema: str = "dbo") -> str:
+    sql = MISSING_INDEXES_SQL
     params: list[str] = []
     if table_name:
-        sql += " AND OBJECT_NAME(mid.object_id) = ? AND s.name = ?"
+        sql += MISSING_INDEXES_TABLE_FILTER
         params.extend([table_name, schema])
 
-    sql += " ORDER BY migs.avg_user_impact * (migs.user_seeks + migs.user_scans) DESC"
+    sql += MISSING_INDEXES_ORDER_BY
 
     return execute_query(database, sql, tuple(params))
 
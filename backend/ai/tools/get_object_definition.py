@@ -1,13 +1,15 @@
 from backend.mssql_db import execute_scalar
 
 
-def get_object_definition(database: str, object_name: str, schema: str = "dbo") -> str:
-    sql = """
+OBJECT_DEFINITION_SQL = """
         select sm.definition
         from sys.sql_modules sm
         where sm.object_id = object_id(QUOTENAME(?) + '.' + QUOTENAME(?))
     """
-    return execute_scalar(database, sql, (schema, object_name))
+
+
+def get_object_definition(database: str, object_name: str, schema: str = "dbo") -> str:
+    return execute_scalar(database, OBJECT_DEFINITION_SQL, (schema, object_name))
 
 
 definition = {
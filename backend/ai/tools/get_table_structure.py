@@ -1,13 +1,12 @@
 import yaml
 
-from backend.mssql_db import execute_query, execute_scalar
+from backend.mssql_db import query_result_sets
 
+from ._cache import SCHEMA_CACHE_TTL, ttl_cache
 from ._columns_sql import COLUMNS_SQL
 
 
-def get_table_structure(database: str, table_name: str, schema: str = "dbo") -> str:
-
-    stats_sql = """
+TABLE_STATS_SQL = """
         with o ( object_id )
         as (
             select object_id(quotename(?) + '.' + quotename(?))
@@ -54,16 +53,13 @@ def get_table_structure(database: str, table_name: str, schema: str = "dbo") ->
 				  and i.index_id in (0, 1)
 			) ds
     """
-    params = (schema, table_name)
-    object_id = execute_scalar(database, "select object_id(quotename(?) + '.' + quotename(?))", params)
-    columns_yaml = execute_query(database, COLUMNS_SQL, (object_id,))
-    stats_yaml = execute_query(database, stats_sql, params)
-    columns = yaml.safe_load(columns_yaml) or []
-    columns_cleared = [item["col"] for item in columns]
-    stats_list = yaml.safe_load(stats_yaml) or []
-    stats_row = stats_list[0] if stats_list else {}
-    combined = {
-        "columns": columns_cleared,
+
+
+def table_structure_summary(columns: list[dict], stats: list[dict]) -> dict:
+    """Combine the COLUMNS_SQL and TABLE_STATS_SQL result sets; shared with describe_table."""
+    stats_row = stats[0] if stats else {}
+    return {
+        "columns": [item["col"] for item in columns],
         "row_count": stats_row.get("row_count"),
         "data_size_mb": stats_row.get("data_size_mb"),
         "index_count": stats_row.get("index_count"),
@@ -71,7 +67,22 @@ def get_table_structure(database: str, table_name: str, schema: str = "dbo") ->
         "data_space": stats_row.get("data_space"),
         "data_space_type": stats_row.get("data_space_type"),
     }
-    return yaml.dump(combined, allow_unicode=True)
+
+
+# Columns and stats as one batch: a single round trip returning two result sets in this order
+TABLE_STRUCTURE_SQL = (
+    "set nocount on;\n"
+    "declare @object_id int = object_id(quotename(?) + '.' + quotename(?));\n"
+    + COLUMNS_SQL.replace("c.object_id = ?", "c.object_id = @object_id") + ";\n"
+    + TABLE_STATS_SQL + ";"
+)
+
+
+@ttl_cache(SCHEMA_CACHE_TTL)
+def get_table_structure(database: str, table_name: str, schema: str = "dbo") -> str:
+    params = (schema, table_name)
+    columns, stats = query_result_sets(database, TABLE_STRUCTURE_SQL, params + params)
+    return yaml.dump(table_structure_summary(columns, stats), allow_unicode=True)
 
 
 definition = {
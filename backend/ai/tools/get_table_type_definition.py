@@ -1,27 +1,29 @@
 import yaml
 
-from backend.mssql_db import execute_query, execute_scalar
+from backend.mssql_db import query_result_sets
 
 from ._columns_sql import COLUMNS_SQL
 
 
-def get_table_type_definition(database: str, table_type_name: str, schema: str = "dbo") -> str:
-    params = (schema, table_type_name)
-    object_id = execute_scalar(
-        database,
-        """
+TABLE_TYPE_OBJECT_ID_SQL = """
         select type_table_object_id
         from sys.table_types tt
             join sys.schemas s on s.schema_id = tt.schema_id
         where s.name = ?
           and tt.name = ?
-    """,
-        params,
-    )
-    columns_yaml = execute_query(database, COLUMNS_SQL, (object_id,))
-    columns = yaml.safe_load(columns_yaml) or []
-    columns_cleared = [item["col"] for item in columns]
-    return yaml.dump(columns_cleared, allow_unicode=True)
+    """
+
+# Object id lookup and columns as one batch: a single round trip returning the columns result set
+TABLE_TYPE_COLUMNS_SQL = (
+    "set nocount on;\n"
+    "declare @object_id int = (" + TABLE_TYPE_OBJECT_ID_SQL + ");\n"
+    + COLUMNS_SQL.replace("c.object_id = ?", "c.object_id = @object_id") + ";"
+)
+
+
+def get_table_type_definition(database: str, table_type_name: str, schema: str = "dbo") -> str:
+    (columns,) = query_result_sets(database, TABLE_TYPE_COLUMNS_SQL, (schema, table_type_name))
+    return yaml.dump([item["col"] for item in columns], allow_unicode=True)
 
 
 definition = {
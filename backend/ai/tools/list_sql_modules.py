@@ -1,10 +1,9 @@
 import yaml
 
-from backend.mssql_db import execute_query
+from backend.mssql_db import query_result_sets
 
 
-def list_sql_modules(database: str, object_type: str) -> str:
-    sql = """
+SQL_MODULES_SQL = """
         select concat(s.name, '.', o.name) as name
         from sys.sql_modules sm
             join sys.objects o on sm.object_id = o.object_id
@@ -13,11 +12,13 @@ def list_sql_modules(database: str, object_type: str) -> str:
            or o.type_desc = UPPER(?)
         order by o.type, s.name        
     """
+
+
+def list_sql_modules(database: str, object_type: str) -> str:
     object_type_normalized = object_type.strip()
-    module_names = execute_query(database, sql, (object_type_normalized, object_type_normalized))
-    names = yaml.safe_load(module_names) or []
-    names_cleared = [item["name"] for item in names]
-    return yaml.dump(names_cleared, allow_unicode=True)
+    # Records come back as dicts, so the names are dumped without a YAML round trip
+    (names,) = query_result_sets(database, SQL_MODULES_SQL, (object_type_normalized, object_type_normalized))
+    return yaml.dump([item["name"] for item in names], allow_unicode=True)
 
 
 definition = {
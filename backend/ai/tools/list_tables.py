@@ -1,8 +1,9 @@
 from backend.mssql_db import execute_query
 
+from ._cache import SCHEMA_CACHE_TTL, ttl_cache
 
-def list_tables(database: str) -> str:
-    sql = """
+
+LIST_TABLES_SQL = """
         select
             concat(tt.table_schema, '.', tt.table_name) as table_name
           , tt.table_type
@@ -24,7 +25,11 @@ def list_tables(database: str) -> str:
             ) stat
         order by table_type, table_name
     """
-    return execute_query(database, sql)
+
+
+@ttl_cache(SCHEMA_CACHE_TTL)
+def list_tables(database: str) -> str:
+    return execute_query(database, LIST_TABLES_SQL)
 
 
 definition = {
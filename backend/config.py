@@ -12,7 +12,6 @@ LLM_MODEL = os.getenv("LLM_MODEL")
 
 ROOT_DIR = Path(__file__).resolve().parent.parent
 DATA_DIR = ROOT_DIR / "data"
-DATA_DIR.mkdir(parents=True, exist_ok=True) # Ensure data directory exists
 
 
 _log = logging.getLogger(__name__)
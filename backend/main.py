@@ -1,8 +1,11 @@
+import asyncio
 import logging.config
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
 from uvicorn.config import LOGGING_CONFIG
 
 _log_config = deepcopy(LOGGING_CONFIG)
@@ -21,18 +24,31 @@ from backend.web.routers.chat_files import router as chat_files_router
 from backend.web.routers.chats import router as chats_router
 from backend.web.routers.databases import router as databases_router
 from backend.web.frontend_mount import mount_frontend
-from backend.ai.store import init_db
+from backend.ai.store import close_connections, init_db
 from backend.web.websocket_chat import router as websocket_router
+from backend.mssql_db import DRIVER_POOL_MAX_SIZE
+
+# The default executor runs every asyncio.to_thread call: tool calls (SQL Server queries) as well as
+# store reads and writes. Sync endpoints run on FastAPI's own threadpool (anyio's 40 threads) and
+# may query SQL Server too. Both together must stay below the driver's connection pool cap, which
+# raises instead of waiting once it is exhausted.
+FASTAPI_THREADPOOL_SIZE = 40
+TOOL_EXECUTOR_WORKERS = min(32, DRIVER_POOL_MAX_SIZE - FASTAPI_THREADPOOL_SIZE)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     validate_config()
     init_db()
+    executor = ThreadPoolExecutor(max_workers=TOOL_EXECUTOR_WORKERS, thread_name_prefix="tool")
+    asyncio.get_running_loop().set_default_executor(executor)
     yield
+    executor.shutdown(wait=False)
+    close_connections()
 
 
 app = FastAPI(title="AI da DBA", lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 app.include_router(databases_router)
 app.include_router(chats_router)
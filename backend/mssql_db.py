@@ -1,21 +1,40 @@
+import time
+
 import yaml
 from mssql_python import Connection, Cursor, SQL_ATTR_LOGIN_TIMEOUT, connect
 
 from backend.config import SQL_SERVER
 
 MAX_ROWS = 1000
+FETCH_BATCH_SIZE = 256
 QUERY_TIMEOUT = 30
 
+# Cursors live for a single call, so a prepared handle is never reused; executing directly
+# (sp_executesql when parameterized) skips the prepare/unprepare round trips and still lets
+# SQL Server cache the plan by statement text.
+USE_PREPARE = False
+
+# mssql_python enables its driver-level pool on first connect (up to 100 connections). Closing a
+# connection returns it, reset, to the pool, so every `with get_connection(...)` reuses a warm,
+# already authenticated session. A full pool raises instead of waiting, so callers that run
+# SQL concurrently (the event loop's default executor, see main.py) must stay below that cap.
+DRIVER_POOL_MAX_SIZE = 100
+
+# The database list is near-static but requested on every page load; serve it from memory briefly
+DATABASE_LIST_CACHE_TTL = 30.0
+
+_database_list_cache: tuple[float, list[str]] | None = None
+
 _connection_string = (
     f"SERVER={SQL_SERVER};"
     f"Trusted_Connection=yes;"
 )
+# Prefix for per-database connections; SQL_SERVER is concatenated, never str.format'ed, so braces are safe
+_database_connection_prefix = _connection_string + "DATABASE="
 
 
 def get_connection(database: str | None = None) -> Connection:
-    cs = _connection_string
-    if database:
-        cs += f"DATABASE={database};"
+    cs = f"{_database_connection_prefix}{database};" if database else _connection_string
     return connect(
         cs,
         attrs_before={SQL_ATTR_LOGIN_TIMEOUT: QUERY_TIMEOUT},
@@ -23,6 +42,11 @@ def get_connection(database: str | None = None) -> Connection:
 
 
 def list_databases() -> list[str]:
+    """Return online user database names. Cached for DATABASE_LIST_CACHE_TTL."""
+    global _database_list_cache
+    now = time.monotonic()
+    if _database_list_cache and now - _database_list_cache[0] < DATABASE_LIST_CACHE_TTL:
+        return list(_database_list_cache[1])
     with get_connection() as conn:
         cursor = conn.cursor()
         cursor.execute(
@@ -31,51 +55,127 @@ def list_databases() -> list[str]:
             "AND name NOT IN ('master', 'tempdb', 'model', 'msdb') "
             "ORDER BY name"
         )
-        return [row[0] for row in cursor.fetchall()]
+        names = [row[0] for row in cursor.fetchall()]
+    _database_list_cache = (now, names)
+    return list(names)
+
 
+# Columns whose driver type already serializes as-is are passed through without a per-cell check
+_PASSTHROUGH_TYPES = (str, int, float, bool)
 
-def rows_to_yaml(cursor: Cursor, max_rows: int = MAX_ROWS) -> str:
+
+def _convert_value(val):
+    if isinstance(val, (bytes, bytearray)):
+        return val.hex()
+    if isinstance(val, (str, int, float, bool, type(None))):
+        return val
+    return str(val)
+
+
+def _estimated_yaml_chars(record: dict) -> int:
+    """Rough size of a record once dumped as YAML (key, value and a few chars of punctuation per field)."""
+    return sum(len(k) + (len(v) if isinstance(v, str) else len(str(v))) + 4 for k, v in record.items())
+
+
+def _record_converter(cursor: Cursor):
+    """Return a function turning a batch of driver rows of the current result set into YAML-safe dicts."""
     columns = [desc[0] for desc in cursor.description]
-    rows = cursor.fetchmany(max_rows + 1)
+    convert_idxs = [i for i, desc in enumerate(cursor.description) if desc[1] not in _PASSTHROUGH_TYPES]
 
-    truncated = len(rows) > max_rows
-    if truncated:
-        rows = rows[:max_rows]
+    def to_records(rows) -> list[dict]:
+        if not convert_idxs:
+            return [dict(zip(columns, row)) for row in rows]
+        records = []
+        for row in rows:
+            vals = list(row)
+            for i in convert_idxs:
+                vals[i] = _convert_value(vals[i])
+            records.append(dict(zip(columns, vals)))
+        return records
 
+    return to_records
+
+
+def fetch_records(cursor: Cursor, max_rows: int = MAX_ROWS) -> list[dict]:
+    """Read up to max_rows of the current result set as dicts of YAML-safe values."""
+    to_records = _record_converter(cursor)
+    result = []
+    while len(result) < max_rows:
+        rows = cursor.fetchmany(min(FETCH_BATCH_SIZE, max_rows - len(result)))
+        if not rows:
+            break
+        result.extend(to_records(rows))
+    return result
+
+
+def rows_to_yaml(cursor: Cursor, max_rows: int = MAX_ROWS, max_chars: int | None = None) -> str:
+    """Dump a result set as YAML. Stops at max_rows, or early once the output would exceed about max_chars."""
+    to_records = _record_converter(cursor)
+
+    # Convert rows batch by batch so driver rows and converted records are never both fully held
     result = []
-    for row in rows:
-        record = {}
-        for col, val in zip(columns, row):
-            if isinstance(val, (bytes, bytearray)):
-                record[col] = val.hex()
-            elif isinstance(val, (str, int, float, bool, type(None))):
-                record[col] = val
-            else:
-                record[col] = str(val)
-        result.append(record)
+    size = 0
+    more_rows = False
+    while len(result) < max_rows:
+        rows = cursor.fetchmany(min(FETCH_BATCH_SIZE, max_rows - len(result)))
+        if not rows:
+            break
+        records = to_records(rows)
+        if max_chars is None:
+            result.extend(records)
+            continue
+        for n, record in enumerate(records, 1):
+            result.append(record)
+            size += _estimated_yaml_chars(record)
+            if size >= max_chars:
+                more_rows = n < len(records)
+                break
+        if size >= max_chars:
+            break
+
+    size_limited = max_chars is not None and size >= max_chars
+    truncated = (len(result) == max_rows or size_limited) and (more_rows or cursor.fetchone() is not None)
 
     if truncated:
+        note = f"Showing first {len(result)} rows"
+        if size_limited:
+            note += " (result size limit reached)"
         data = {
             "rows": result,
             "truncated": True,
-            "note": f"Showing first {max_rows} rows",
+            "note": note,
         }
         return yaml.dump(data, allow_unicode=True)
     return yaml.dump(result, allow_unicode=True)
 
 
-def execute_query(database: str, sql: str, params: tuple = ()) -> str:
+def execute_query(database: str, sql: str, params: tuple = (), max_chars: int | None = None) -> str:
     with get_connection(database) as conn:
         cursor = conn.cursor()
-        cursor.execute(sql, params)
+        cursor.execute(sql, params, use_prepare=USE_PREPARE)
         if cursor.description:
-            return rows_to_yaml(cursor)
+            return rows_to_yaml(cursor, max_chars=max_chars)
         return yaml.dump({"affected_rows": cursor.rowcount}, allow_unicode=True)
 
+
+def query_result_sets(database: str, sql: str, params: tuple = ()) -> list[list[dict]]:
+    """Run a multi-statement batch in one round trip; return each result set as records (up to MAX_ROWS each)."""
+    with get_connection(database) as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params, use_prepare=USE_PREPARE)
+        result_sets = []
+        while True:
+            if cursor.description:
+                result_sets.append(fetch_records(cursor))
+            if not cursor.nextset():
+                break
+        return result_sets
+
+
 def execute_scalar(database: str, sql: str, params: tuple = ()) -> str | None:
     with get_connection(database) as conn:
         cursor = conn.cursor()
-        cursor.execute(sql, params)
+        cursor.execute(sql, params, use_prepare=USE_PREPARE)
 
         # no result set (e.g. update/delete)
         if not cursor.description:
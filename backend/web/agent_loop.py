@@ -1,18 +1,39 @@
-import json
+import asyncio
 import logging
+from functools import lru_cache
 
+import httpx
+import orjson
 from fastapi import WebSocket
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 
 from backend.config import API_KEY, API_URL, LLM_MODEL
-from backend.ai.prompts import get_system_prompt
-from backend.ai.store import ChatMessage, append_chat_messages, get_chat_messages, get_chat_token_stats, get_db_description
+from backend.ai.prompts import build_system_content
+from backend.ai.store import ChatMessage, get_chat_token_stats, get_db_description, stored_message
 from backend.ai.tools import TOOL_DEFINITIONS, dispatch_tool
+from backend.web.common.chat_persistence import persist_messages, wait_for_pending_writes
+from backend.web.common.ws_messages import send_json, send_stream, send_stream_end
 
 log = logging.getLogger(__name__)
-    
-llm_client = OpenAI(api_key=API_KEY, base_url=API_URL)
-    
+
+LLM_MAX_CONNECTIONS = 100
+LLM_MAX_KEEPALIVE_CONNECTIONS = 32
+# Idle connections survive the gap between a tool round and the next LLM call
+LLM_KEEPALIVE_EXPIRY = 60.0
+
+
+@lru_cache(maxsize=1)
+def get_llm_client() -> AsyncOpenAI:
+    """Process-wide LLM client; its HTTP connection pool is reused across turns."""
+    http_client = DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+    )
+    return AsyncOpenAI(api_key=API_KEY, base_url=API_URL, http_client=http_client)
+
 EMPTY_TOKEN_STATS: dict = {
     "last_prompt_tokens": 0,
     "total_prompt_tokens": 0,
@@ -22,13 +43,22 @@ EMPTY_TOKEN_STATS: dict = {
 
 MAX_TOOL_ROUNDS = 10
 MAX_TOOL_RESULT_LENGTH = 80_000
+# Older history is dropped beyond this many messages, always cutting at a user turn. The cut point
+# only moves in steps of HISTORY_TRIM_STEP, so the prompt prefix (and the provider's prompt cache)
+# stays stable between cuts instead of shifting on every turn.
+MAX_HISTORY_MESSAGES = 200
+HISTORY_TRIM_STEP = 100
+
+# Streamed deltas are coalesced into one WebSocket frame until either limit is hit
+STREAM_FLUSH_CHARS = 256
+STREAM_FLUSH_INTERVAL = 0.015
 
 
 def _parse_tool_args(tc: dict) -> dict:
     """Parse tool call arguments JSON. Returns {} on decode error."""
     try:
-        return json.loads(tc["function"]["arguments"])
-    except (json.JSONDecodeError, KeyError, TypeError):
+        return orjson.loads(tc["function"]["arguments"])
+    except (orjson.JSONDecodeError, KeyError, TypeError):
         return {}
 
 
@@ -86,8 +116,9 @@ def _extract_completion_tokens(usage_data: dict | None) -> int | None:
 
 
 async def _send_chat_token_update(ws: WebSocket, chat_id: int) -> None:
-    stats = get_chat_token_stats(chat_id)
-    await ws.send_text(json.dumps({"type": "chat_tokens", "chat_id": chat_id, **stats}))
+    await wait_for_pending_writes(chat_id)
+    stats = await asyncio.to_thread(get_chat_token_stats, chat_id)
+    await send_json(ws, {"type": "chat_tokens", "chat_id": chat_id, **stats})
 
 
 def chat_messages_to_api_messages(stored: list[ChatMessage]) -> list[dict]:
@@ -122,28 +153,72 @@ def chat_messages_to_api_messages(stored: list[ChatMessage]) -> list[dict]:
     return api_messages
 
 
+def _history_cut(api_messages: list[dict]) -> int:
+    """Index where the kept history starts: at most MAX_HISTORY_MESSAGES remain, starting at a user message
+    so no tool reply loses its call. The cut is at or after a multiple of HISTORY_TRIM_STEP, so it stays put
+    until the next step is crossed."""
+    excess = len(api_messages) - MAX_HISTORY_MESSAGES
+    if excess <= 0:
+        return 0
+    start = (excess // HISTORY_TRIM_STEP + 1) * HISTORY_TRIM_STEP
+    for i in range(start, len(api_messages)):
+        if api_messages[i]["role"] == "user":
+            return i
+    return len(api_messages) - 1
+
+
+def _trim_history(api_messages: list[dict]) -> list[dict]:
+    cut = _history_cut(api_messages)
+    return api_messages[cut:] if cut else api_messages
+
+
+def trim_history_in_place(api_messages: list[dict]) -> int:
+    """Drop the history the prompt no longer includes from a session's cached list; return how many went."""
+    cut = _history_cut(api_messages)
+    del api_messages[:cut]
+    return cut
+
+
 async def run_agent_loop(
     ws: WebSocket,
     database: str,
     agent_role: str,
     chat_id: int,
+    history: list[dict],
+    user_msg: ChatMessage,
+):
+    """Run one user turn. `history` holds the chat's API messages (ending with the new user message)
+    and is extended in place with everything this turn persists.
+
+    `user_msg` is written together with the first round's messages in one transaction; if the turn
+    ends before any round is persisted it is still written on the way out."""
+    unsaved = [user_msg]
+    try:
+        await _run_rounds(ws, database, agent_role, chat_id, history, unsaved)
+    finally:
+        if unsaved:
+            persist_messages(chat_id, unsaved)
+
+
+async def _run_rounds(
+    ws: WebSocket,
+    database: str,
+    agent_role: str,
+    chat_id: int,
+    history: list[dict],
+    unsaved: list[ChatMessage],
 ):
-    description = get_db_description(database) or ""
-    db_context = f"\n\nYou are working with database: {database}."
-    if description:
-        db_context += f" User-provided context: {description}"
-    db_context += "\n"
-    system_content = get_system_prompt(agent_role) + db_context
+    description = await asyncio.to_thread(get_db_description, database)
+    system_content = build_system_content(agent_role, database, description or "")
+
+    trimmed = _trim_history(history)
+    full_messages: list[dict] = [{"role": "system", "content": system_content}, *trimmed]
 
     for round_num in range(MAX_TOOL_ROUNDS):
-        stored = get_chat_messages(chat_id)
-        full_messages: list[dict] = [
-            {"role": "system", "content": system_content},
-        ] + chat_messages_to_api_messages(stored)
         log.info("Agent round %d, messages: %d", round_num + 1, len(full_messages))
 
         try:
-            response = llm_client.chat.completions.create(
+            response = await get_llm_client().chat.completions.create(
                 model=LLM_MODEL,
                 messages=full_messages,
                 tools=TOOL_DEFINITIONS,
@@ -153,15 +228,23 @@ async def run_agent_loop(
             )
         except Exception as e:
             log.error("LLM call failed: %s", e)
-            await ws.send_text(json.dumps({"type": "error", "content": f"LLM error: {e}"}))
+            await send_json(ws, {"type": "error", "content": f"LLM error: {e}"})
+            persist_messages(chat_id, unsaved)
+            unsaved.clear()
+            await _send_chat_token_update(ws, chat_id)
             return
 
-        collected_msg = ""
-        tools_acc = {}
+        collected_parts: list[str] = []
+        # Tool-call fragments per stream index, joined once the stream ends
+        tools_acc: list[dict[str, list[str]] | None] = []
         next_auto_index = 0
         last_usage_data: dict | None = None
+        loop = asyncio.get_running_loop()
+        pending: list[str] = []
+        pending_len = 0
+        last_flush = loop.time()
 
-        for chunk in response:
+        async for chunk in response:
             usage = getattr(chunk, "usage", None)
             if usage:
                 usage_data = usage.model_dump() if hasattr(usage, "model_dump") else usage
@@ -181,86 +264,115 @@ async def run_agent_loop(
             delta = chunk.choices[0].delta
 
             if delta.content:
-                collected_msg += delta.content
-                await ws.send_text(json.dumps({
-                    "type": "stream",
-                    "content": delta.content
-                }))
+                collected_parts.append(delta.content)
+                pending.append(delta.content)
+                pending_len += len(delta.content)
+                now = loop.time()
+                if pending_len >= STREAM_FLUSH_CHARS or now - last_flush >= STREAM_FLUSH_INTERVAL:
+                    await send_stream(ws, "".join(pending))
+                    pending.clear()
+                    pending_len = 0
+                    last_flush = now
 
             if delta.tool_calls:
+                if pending:
+                    await send_stream(ws, "".join(pending))
+                    pending.clear()
+                    pending_len = 0
+                    last_flush = loop.time()
                 for tc in delta.tool_calls:
                     idx = tc.index if isinstance(tc.index, int) and tc.index >= 0 else next_auto_index
                     if idx >= next_auto_index:
                         next_auto_index = idx + 1
-                    if idx not in tools_acc:
-                        tools_acc[idx] = {
-                            "id": tc.id or "",
-                            "type": "function",
-                            "function": {"name": "", "arguments": ""}
-                        }
+                    if idx >= len(tools_acc):
+                        tools_acc.extend([None] * (idx + 1 - len(tools_acc)))
+                    acc = tools_acc[idx]
+                    if acc is None:
+                        acc = tools_acc[idx] = {"id": [tc.id or ""], "name": [], "arguments": []}
                     if tc.function.name:
-                        tools_acc[idx]["function"]["name"] += tc.function.name
+                        acc["name"].append(tc.function.name)
                     if tc.function.arguments:
-                        tools_acc[idx]["function"]["arguments"] += tc.function.arguments
+                        acc["arguments"].append(tc.function.arguments)
                     if tc.id:
-                        tools_acc[idx]["id"] += tc.id
+                        acc["id"].append(tc.id)
+
+        if pending:
+            await send_stream(ws, "".join(pending))
+        collected_msg = "".join(collected_parts)
 
         pt = _extract_prompt_tokens(last_usage_data)
         cached_tok = _extract_cached_tokens(last_usage_data) if isinstance(last_usage_data, dict) else None
         comp = _extract_completion_tokens(last_usage_data)
 
-        if tools_acc:
-            sorted_calls = [v for _, v in sorted(tools_acc.items())]
+        sorted_calls = [
+            {
+                "id": "".join(acc["id"]),
+                "type": "function",
+                "function": {"name": "".join(acc["name"]), "arguments": "".join(acc["arguments"])},
+            }
+            for acc in tools_acc
+            if acc is not None
+        ]
+        if sorted_calls:
+            # Messages are kept in their stored form everywhere, so history matches a reload from the store
             to_append = [
-                ChatMessage(
+                stored_message(ChatMessage(
                     role="assistant",
                     content=collected_msg or "",
                     tool_calls=sorted_calls,
                     prompt_tokens=pt,
                     cached_tokens=cached_tok,
                     completion_tokens=comp,
-                ),
+                )),
             ]
             for tc in sorted_calls:
                 t_name = tc["function"]["name"]
                 t_args = _parse_tool_args(tc)
                 log.info("Tool call: %s(%s)", t_name, t_args)
-                await ws.send_text(json.dumps({
+                await send_json(ws, {
                     "type": "tool_call",
                     "tool": t_name,
                     "args": t_args,
-                }))
+                })
 
-                result = dispatch_tool(t_name, t_args, database)
+                result = await asyncio.to_thread(dispatch_tool, t_name, t_args, database, MAX_TOOL_RESULT_LENGTH)
                 if result is None or result == "":
                     result = "(tool returned no result)"
                 if len(result) > MAX_TOOL_RESULT_LENGTH:
                     result = result[:MAX_TOOL_RESULT_LENGTH] + "\n\n[... result truncated due to size ...]"
-                await ws.send_text(json.dumps({"type": "tool_result", "result": result}))
+                await send_json(ws, {"type": "tool_result", "result": result})
                 to_append.append(
-                    ChatMessage(
+                    stored_message(ChatMessage(
                         role="tool_call",
                         content=_format_tool_call_content(t_name, t_args),
                         tool_result=result,
                         tool_call_id=tc["id"],
-                    )
+                    ))
                 )
-            append_chat_messages(chat_id, to_append)
-            await _send_chat_token_update(ws, chat_id)
+            # Persisted in the background; token stats are sent once the turn's writes land
+            persist_messages(chat_id, [*unsaved, *to_append])
+            unsaved.clear()
+            new_messages = chat_messages_to_api_messages(to_append)
+            full_messages.extend(new_messages)
+            history.extend(new_messages)
             continue
 
-        append_chat_messages(chat_id, [
-            ChatMessage(
+        final = [
+            stored_message(ChatMessage(
                 role=agent_role,
                 content=collected_msg,
                 prompt_tokens=pt,
                 cached_tokens=cached_tok,
                 completion_tokens=comp,
-            ),
-        ])
+            )),
+        ]
+        persist_messages(chat_id, [*unsaved, *final])
+        unsaved.clear()
+        history.extend(chat_messages_to_api_messages(final))
+        await send_stream_end(ws)
         await _send_chat_token_update(ws, chat_id)
-        await ws.send_text(json.dumps({"type": "stream_end"}))
         return
 
     err_msg = "Agent reached maximum tool call rounds."
-    await ws.send_text(json.dumps({"type": "error", "content": err_msg}))
+    await send_json(ws, {"type": "error", "content": err_msg})
+    await _send_chat_token_update(ws, chat_id)
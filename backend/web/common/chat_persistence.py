@@ -0,0 +1,37 @@
+import asyncio
+import logging
+
+from backend.ai.store import ChatMessage, append_chat_messages
+
+log = logging.getLogger(__name__)
+
+# Last scheduled write per chat; each new write waits for it so messages land in order
+_pending_writes: dict[int, asyncio.Task] = {}
+
+
+async def _write_after(previous: asyncio.Task | None, chat_id: int, messages: list[ChatMessage]) -> None:
+    if previous is not None:
+        await asyncio.gather(previous, return_exceptions=True)
+    await asyncio.to_thread(append_chat_messages, chat_id, messages)
+
+
+def persist_messages(chat_id: int, messages: list[ChatMessage]) -> asyncio.Task:
+    """Append messages to the store in a worker thread, after any earlier write for the same chat."""
+    task = asyncio.create_task(_write_after(_pending_writes.get(chat_id), chat_id, list(messages)))
+    _pending_writes[chat_id] = task
+
+    def _done(t: asyncio.Task) -> None:
+        if _pending_writes.get(chat_id) is t:
+            del _pending_writes[chat_id]
+        if not t.cancelled() and t.exception() is not None:
+            log.error("Failed to persist messages for chat %s: %s", chat_id, t.exception())
+
+    task.add_done_callback(_done)
+    return task
+
+
+async def wait_for_pending_writes(chat_id: int) -> None:
+    """Wait until every scheduled write for the chat has finished (failures are already logged)."""
+    task = _pending_writes.get(chat_id)
+    if task is not None:
+        await asyncio.gather(task, return_exceptions=True)
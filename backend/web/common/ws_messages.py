@@ -0,0 +1,21 @@
+import orjson
+from fastapi import WebSocket
+
+# Fixed parts of the hottest frames, so only the streamed text is encoded per send
+_STREAM_PREFIX = b'{"type":"stream","content":'
+_STREAM_SUFFIX = b"}"
+_STREAM_END = orjson.dumps({"type": "stream_end"})
+
+
+async def send_json(ws: WebSocket, payload: dict) -> None:
+    """Serialize payload with orjson and send it to the client as a binary frame."""
+    await ws.send_bytes(orjson.dumps(payload))
+
+
+async def send_stream(ws: WebSocket, content: str) -> None:
+    """Send a {"type": "stream"} frame; same bytes as send_json without building a dict."""
+    await ws.send_bytes(_STREAM_PREFIX + orjson.dumps(content) + _STREAM_SUFFIX)
+
+
+async def send_stream_end(ws: WebSocket) -> None:
+    await ws.send_bytes(_STREAM_END)
@@ -1,26 +1,33 @@
-import os
 from fastapi.staticfiles import StaticFiles
 from backend.config import ROOT_DIR
 
 FRONTEND_DIR = ROOT_DIR / "frontend"
 
 
-class NoCacheStaticFiles(StaticFiles):
-    """StaticFiles that sends Cache-Control: no-cache for .js and .css (when DEVELOPMENT is set)."""
+def _cache_control(path: str) -> bytes | None:
+    """HTML, .js and .css always revalidate: index.html loads the assets by unversioned URLs, so a deploy
+    must be picked up at once. Starlette's ETag/Last-Modified make the revalidation a cheap 304."""
+    if path.endswith(("/", ".html", ".js", ".css")):
+        return b"no-cache"
+    return None
+
+
+class FrontendStaticFiles(StaticFiles):
+    """StaticFiles that adds Cache-Control headers chosen by _cache_control."""
 
     async def __call__(self, scope, receive, send):
-        path = scope.get("path", "")
-        if path.endswith((".js", ".css")) and os.environ.get("DEVELOPMENT", "").lower() in ("1", "true", "yes"):
-            async def send_with_no_cache(message):
+        cache_control = _cache_control(scope.get("path", ""))
+        if cache_control is not None:
+            async def send_with_cache_control(message):
                 if message.get("type") == "http.response.start":
                     headers = list(message.get("headers", []))
-                    headers.append((b"cache-control", b"no-cache"))
+                    headers.append((b"cache-control", cache_control))
                     message = {**message, "headers": headers}
                 await send(message)
-            await super().__call__(scope, receive, send_with_no_cache)
+            await super().__call__(scope, receive, send_with_cache_control)
         else:
             await super().__call__(scope, receive, send)
 
 
 def mount_frontend(app):
-    app.mount("/", NoCacheStaticFiles(directory=str(FRONTEND_DIR), html=True), name="frontend")
+    app.mount("/", FrontendStaticFiles(directory=str(FRONTEND_DIR), html=True), name="frontend")
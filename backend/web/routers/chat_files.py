@@ -1,8 +1,15 @@
+import asyncio
+import codecs
 import os
 import re
+import stat
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
 
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
+from fastapi.responses import FileResponse, Response
 
 from backend.config import DATA_DIR
 from backend.web.common.dependencies import require_chat_belongs_to_db
@@ -14,14 +21,27 @@ MAX_FILE_SIZE_BYTES = 2 * 1024 * 1024  # 2 MB
 MAX_FILES_PER_MESSAGE = 10
 ALLOWED_EXTENSIONS = {".txt", ".sql", ".xml", ".json", ".md", ".csv", ".xdl", ".sqlplan"}
 ALLOWED_CONTENT_TYPE_PREFIX = "text/"
+UPLOAD_CHUNK_SIZE = 64 * 1024
+CHAT_FILE_MAX_AGE = 300
 
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^\w\-.]")
 
+# Attachments are re-read on every message that references them; keep decoded text keyed by
+# (chat_id, name, mtime_ns, size) so a re-upload is never served stale
+ATTACHMENT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_attachment_cache: OrderedDict[tuple[int, str, int, int], str] = OrderedDict()
+_attachment_cache_bytes = 0
+_attachment_cache_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1024)
 def sanitize_filename(name: str) -> str:
     """Return a safe filename: basename only, no .., only word chars, hyphens, dots."""
     base = os.path.basename(name)
     if not base:
         base = "unnamed"
-    safe = re.sub(r"[^\w\-.]", "_", base)
+    safe = _UNSAFE_FILENAME_CHARS.sub("_", base)
     return safe or "unnamed"
 
 
@@ -35,6 +55,88 @@ def _is_allowed_file(filename: str, content_type: str | None) -> bool:
     return False
 
 
+@lru_cache(maxsize=1024)
+def chat_files_dir(chat_id: int) -> Path:
+    """Directory holding a chat's uploaded files (may not exist yet)."""
+    return FILES_DIR / str(chat_id)
+
+
+# Chat directories already created by this process, so uploads skip the mkdir syscall
+_ensured_chat_dirs: set[int] = set()
+
+
+def _ensure_chat_files_dir(chat_id: int) -> Path:
+    chat_dir = chat_files_dir(chat_id)
+    if chat_id not in _ensured_chat_dirs:
+        chat_dir.mkdir(parents=True, exist_ok=True)
+        _ensured_chat_dirs.add(chat_id)
+    return chat_dir
+
+
+def forget_chat_files_dir(chat_id: int) -> None:
+    """Forget that a chat's directory exists (call when the chat is deleted)."""
+    _ensured_chat_dirs.discard(chat_id)
+
+
+def read_attachment(chat_id: int, safe_name: str) -> str | None:
+    """Return the text of an uploaded chat file, or None if it does not exist. Served from an LRU when unchanged."""
+    global _attachment_cache_bytes
+    path = chat_files_dir(chat_id) / safe_name
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    key = (chat_id, safe_name, st.st_mtime_ns, st.st_size)
+    with _attachment_cache_lock:
+        text = _attachment_cache.get(key)
+        if text is not None:
+            _attachment_cache.move_to_end(key)
+            return text
+
+    text = path.read_text(encoding="utf-8")
+    if st.st_size > ATTACHMENT_CACHE_MAX_BYTES:
+        return text
+    with _attachment_cache_lock:
+        if key not in _attachment_cache:
+            _attachment_cache[key] = text
+            _attachment_cache_bytes += st.st_size
+        while _attachment_cache_bytes > ATTACHMENT_CACHE_MAX_BYTES:
+            old_key, _ = _attachment_cache.popitem(last=False)
+            _attachment_cache_bytes -= old_key[3]
+    return text
+
+
+def _forget_attachment(chat_id: int, safe_name: str) -> None:
+    """Drop cached text of a chat file that is being replaced."""
+    global _attachment_cache_bytes
+    with _attachment_cache_lock:
+        for key in [k for k in _attachment_cache if k[0] == chat_id and k[1] == safe_name]:
+            del _attachment_cache[key]
+            _attachment_cache_bytes -= key[3]
+
+
+def _save_upload(src, path: Path) -> bool:
+    """Stream an uploaded file into path as UTF-8 text (invalid bytes replaced).
+    Writes to a .part file first; returns False, leaving nothing behind, if it exceeds MAX_FILE_SIZE_BYTES."""
+    part = path.with_name(path.name + ".part")
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    total = 0
+    try:
+        with open(part, "w", encoding="utf-8") as out:
+            while chunk := src.read(UPLOAD_CHUNK_SIZE):
+                total += len(chunk)
+                if total > MAX_FILE_SIZE_BYTES:
+                    return False
+                out.write(decoder.decode(chunk))
+            out.write(decoder.decode(b"", final=True))
+        os.replace(part, path)
+        return True
+    finally:
+        part.unlink(missing_ok=True)
+
+
 @router.post("/{name}/chats/{chat_id}/files")
 async def api_upload_chat_files(
     name: str,
@@ -46,8 +148,7 @@ async def api_upload_chat_files(
     if not files:
         return {"uploaded": [], "errors": ["No files provided"]}
 
-    chat_dir = FILES_DIR / str(chat_id)
-    chat_dir.mkdir(parents=True, exist_ok=True)
+    chat_dir = await asyncio.to_thread(_ensure_chat_files_dir, chat_id)
     uploaded = []
     errors = []
     for f in files[:MAX_FILES_PER_MESSAGE]:
@@ -56,41 +157,43 @@ async def api_upload_chat_files(
         if not _is_allowed_file(original, f.content_type):
             errors.append(f"{original}: unsupported type (use .txt, .sql, .xml, .json, .md, .csv or text/*)")
             continue
-        try:
-            body = await f.read()
-        except Exception as e:
-            errors.append(f"{original}: read failed — {e}")
-            continue
-        if len(body) > MAX_FILE_SIZE_BYTES:
-            errors.append(f"{original}: file too large (max {MAX_FILE_SIZE_BYTES // (1024*1024)} MB)")
-            continue
-        try:
-            decoded = body.decode("utf-8", errors="replace")
-        except Exception:
-            errors.append(f"{original}: not valid text (UTF-8)")
-            continue
         path = chat_dir / safe
         try:
-            path.write_text(decoded, encoding="utf-8")
+            saved = await asyncio.to_thread(_save_upload, f.file, path)
         except Exception as e:
             errors.append(f"{original}: write failed — {e}")
             continue
+        if not saved:
+            errors.append(f"{original}: file too large (max {MAX_FILE_SIZE_BYTES // (1024*1024)} MB)")
+            continue
+        _forget_attachment(chat_id, safe)
         uploaded.append({"filename": original, "saved_as": safe})
     return {"uploaded": uploaded, "errors": errors if errors else None}
 
 
 @router.get("/{name}/chats/{chat_id}/files/{filename}")
 def api_get_chat_file(
+    request: Request,
     name: str,
     chat_id: int,
     filename: str,
     _: str = Depends(require_chat_belongs_to_db),
 ):
-    """Download a previously uploaded chat file. Filename is sanitized."""
+    """Download a previously uploaded chat file. Filename is sanitized. Answers 304 when the client's ETag matches."""
     safe = sanitize_filename(filename)
     if not safe:
         raise HTTPException(status_code=400, detail="Invalid filename")
-    path = FILES_DIR / str(chat_id) / safe
-    if not path.is_file():
+    path = chat_files_dir(chat_id) / safe
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(path, filename=safe)
+    headers = {
+        "ETag": f'"{st.st_mtime_ns:x}-{st.st_size:x}"',
+        "Cache-Control": f"private, max-age={CHAT_FILE_MAX_AGE}",
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, filename=safe, headers=headers, stat_result=st)
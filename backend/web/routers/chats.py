@@ -3,6 +3,7 @@ import logging
 from fastapi import APIRouter, Body, Depends, HTTPException
 
 from backend.web.common.dependencies import require_chat_belongs_to_db
+from backend.web.routers.chat_files import forget_chat_files_dir
 from backend.ai.store import (
     create_chat,
     delete_chat,
@@ -51,9 +52,9 @@ def api_set_chat_title(
         title = (body or {}).get("title", "Новый чат") or "Новый чат"
         update_chat_title(chat_id, title)
         return {"ok": True, "title": title}
+    except HTTPException:
+        raise
     except Exception as e:
-        if hasattr(e, "status_code"):
-            raise
         log.error("Failed to set title for chat %s: %s", chat_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -70,9 +71,9 @@ def api_set_chat_starred(
         starred = (body or {}).get("starred", False)
         set_chat_starred(chat_id, bool(starred))
         return {"ok": True, "starred": bool(starred)}
+    except HTTPException:
+        raise
     except Exception as e:
-        if hasattr(e, "status_code"):
-            raise
         log.error("Failed to set starred for chat %s: %s", chat_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -86,6 +87,7 @@ def api_delete_chat(
     """Delete a chat. Chat must belong to this database."""
     try:
         delete_chat(chat_id)
+        forget_chat_files_dir(chat_id)
         return {"ok": True}
     except HTTPException:
         raise
@@ -3,7 +3,7 @@ import logging
 from fastapi import APIRouter, Body
 
 from backend.mssql_db import list_databases
-from backend.ai.store import get_db_description, set_db_description
+from backend.ai.store import get_db_descriptions, set_db_description
 
 log = logging.getLogger(__name__)
 
@@ -14,8 +14,9 @@ router = APIRouter(prefix="/api/databases", tags=["databases"])
 def api_databases():
     try:
         names = list_databases()
+        descriptions = get_db_descriptions(names)
         databases = [
-            {"name": n, "description": get_db_description(n) or ""}
+            {"name": n, "description": descriptions.get(n, "")}
             for n in names
         ]
         return {"databases": databases}
@@ -1,17 +1,28 @@
-import json
+import asyncio
 import logging
+from dataclasses import dataclass, field
 
+import orjson
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
-from backend.web.agent_loop import EMPTY_TOKEN_STATS, run_agent_loop
+from backend.web.agent_loop import (
+    EMPTY_TOKEN_STATS,
+    chat_messages_to_api_messages,
+    run_agent_loop,
+    trim_history_in_place,
+)
+from backend.web.common.chat_persistence import wait_for_pending_writes
+from backend.web.common.ws_messages import send_json
 from backend.ai.prompts import DEFAULT_ROLE
-from backend.web.routers.chat_files import FILES_DIR, sanitize_filename
+from backend.web.routers.chat_files import chat_files_dir, read_attachment, sanitize_filename
 from backend.ai.store import (
     ChatMessage,
-    append_chat_messages,
+    count_chat_messages,
     create_chat,
     get_chat_messages,
     get_chat_token_stats,
+    load_chat,
+    stored_message,
 )
 
 log = logging.getLogger(__name__)
@@ -19,126 +30,187 @@ log = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@router.websocket("/ws")
-async def ws_chat(ws: WebSocket):
-    await ws.accept()
+@dataclass
+class _SessionState:
+    """Per-connection chat state shared by the message handlers."""
     database: str | None = None
     chat_id: int | None = None
     agent_role: str = DEFAULT_ROLE
+    # API-ready history of the current chat, built once and extended by each turn; None until loaded.
+    # Each message this session persists is appended as exactly one API message, so the store holds
+    # len(api_messages) + skipped_rows rows unless another session wrote to the chat meanwhile.
+    api_messages: list[dict] | None = None
+    # Stored rows with no API message: tool calls without a result, and history trimmed off the front
+    skipped_rows: int = 0
+    written_chat_ids: set[int] = field(default_factory=set)
+
+
+def _set_history(state: _SessionState, history: list[ChatMessage]) -> None:
+    state.api_messages = chat_messages_to_api_messages(history)
+    state.skipped_rows = len(history) - len(state.api_messages)
+
+
+async def _handle_set_chat(ws: WebSocket, payload: dict, state: _SessionState) -> None:
+    cid = payload.get("chat_id")
+    if cid is None:
+        await send_json(ws, {"type": "error", "content": "chat_id required"})
+        return
+    chat_id = int(cid)
+    await wait_for_pending_writes(chat_id)
+    database_name, history = await asyncio.to_thread(load_chat, chat_id)
+    if database_name is None:
+        await send_json(ws, {"type": "error", "content": "Chat not found"})
+        return
+    state.chat_id = chat_id
+    token_stats = await asyncio.to_thread(get_chat_token_stats, state.chat_id)
+    _set_history(state, history)
+    await send_json(ws, {
+        "type": "history_loaded",
+        "messages": [
+            {
+                "role": m.role,
+                "content": m.content,
+                **({"tool_result": m.tool_result} if m.role == "tool_call" and m.tool_result else {}),
+            }
+            for m in history
+        ],
+        "token_stats": token_stats,
+    })
+
+
+async def _handle_set_database(ws: WebSocket, payload: dict, state: _SessionState) -> None:
+    db_name = payload.get("database")
+    if not db_name:
+        await send_json(ws, {"type": "error", "content": "database required"})
+        return
+    state.database = str(db_name)
+    state.chat_id = None
+    state.api_messages = None
+    await send_json(ws, {
+        "type": "history_loaded",
+        "messages": [],
+        "token_stats": EMPTY_TOKEN_STATS,
+    })
+
+
+async def _handle_create_chat(ws: WebSocket, payload: dict, state: _SessionState) -> None:
+    if not state.database:
+        await send_json(ws, {"type": "error", "content": "Select a database first."})
+        return
+    title = payload.get("title", "Новый чат") or "Новый чат"
+    chat = await asyncio.to_thread(create_chat, state.database, title)
+    state.chat_id = chat["id"]
+    state.api_messages = []
+    state.skipped_rows = 0
+    await send_json(ws, {
+        "type": "chat_created",
+        "chat": chat,
+    })
+    await send_json(ws, {
+        "type": "history_loaded",
+        "messages": [],
+        "token_stats": await asyncio.to_thread(get_chat_token_stats, state.chat_id),
+    })
+
+
+async def _handle_message(ws: WebSocket, payload: dict, state: _SessionState) -> None:
+    if not state.database:
+        await send_json(ws, {
+            "type": "error",
+            "content": "Please select a database first.",
+        })
+        return
+    if state.chat_id is None:
+        await send_json(ws, {
+            "type": "error",
+            "content": "Please select or create a chat first.",
+        })
+        return
+    chat_id = state.chat_id
+
+    user_text = (payload.get("content") or "").strip()
+    attachments = payload.get("attachments") or []
+    if isinstance(attachments, list):
+        attachments = [str(a) for a in attachments]
+    else:
+        attachments = []
+
+    combined_parts = []
+    chat_dir = chat_files_dir(chat_id)
+    log.info("Message attachments: %s (chat_id=%s, dir=%s)", attachments, chat_id, chat_dir)
+    for att_name in attachments:
+        safe = sanitize_filename(att_name)
+        if not safe:
+            continue
+        try:
+            content = await asyncio.to_thread(read_attachment, chat_id, safe)
+        except Exception as e:
+            log.warning("Failed to read attachment %s: %s", safe, e)
+            continue
+        if content is None:
+            log.warning("Attachment not found: %s (chat_id=%s) path=%s", safe, chat_id, chat_dir / safe)
+            continue
+        combined_parts += ("Attached file: ", safe, "\n\n", content, "\n\n---\n\n")
+        log.info("Read attachment %s: %d chars", safe, len(content))
+
+    # One join builds the message; attachment text is copied exactly once
+    if combined_parts:
+        combined_parts.append(user_text)
+        full_content = "".join(combined_parts)
+    else:
+        full_content = user_text
+
+    await wait_for_pending_writes(chat_id)
+    if state.api_messages is not None:
+        # Another tab or session may have added turns to this chat; its history is then stale
+        stored = await asyncio.to_thread(count_chat_messages, chat_id)
+        if stored != len(state.api_messages) + state.skipped_rows:
+            state.api_messages = None
+    if state.api_messages is None:
+        _set_history(state, await asyncio.to_thread(get_chat_messages, chat_id))
+
+    # The stored form (stripped, size-capped) is what the model sees now and after any reload
+    user_msg = stored_message(ChatMessage(role="user", content=full_content))
+    state.written_chat_ids.add(chat_id)
+    state.api_messages.extend(chat_messages_to_api_messages([user_msg]))
+
+    await run_agent_loop(ws, state.database, state.agent_role, chat_id, state.api_messages, user_msg)
+    # Bound the cached history like the prompt; dropped messages are still stored rows
+    state.skipped_rows += trim_history_in_place(state.api_messages)
+
+
+# Inbound message type -> handler; unknown types are ignored
+_HANDLERS = {
+    "set_chat": _handle_set_chat,
+    "set_database": _handle_set_database,
+    "create_chat": _handle_create_chat,
+    "message": _handle_message,
+}
+
+
+@router.websocket("/ws")
+async def ws_chat(ws: WebSocket):
+    await ws.accept()
+    state = _SessionState()
 
     try:
         while True:
             raw = await ws.receive_text()
-            payload = json.loads(raw)
-
-            if payload.get("type") == "set_chat":
-                cid = payload.get("chat_id")
-                if cid is None:
-                    await ws.send_text(json.dumps({"type": "error", "content": "chat_id required"}))
-                    continue
-                chat_id = int(cid)
-                history = get_chat_messages(chat_id)
-                await ws.send_text(json.dumps({
-                    "type": "history_loaded",
-                    "messages": [
-                        {
-                            "role": m.role,
-                            "content": m.content,
-                            **({"tool_result": m.tool_result} if m.role == "tool_call" and m.tool_result else {}),
-                        }
-                        for m in history
-                    ],
-                    "token_stats": get_chat_token_stats(chat_id),
-                }))
-                continue
-
-            if payload.get("type") == "set_database":
-                db_name = payload.get("database")
-                if not db_name:
-                    await ws.send_text(json.dumps({"type": "error", "content": "database required"}))
-                    continue
-                database = str(db_name)
-                chat_id = None
-                await ws.send_text(json.dumps({
-                    "type": "history_loaded",
-                    "messages": [],
-                    "token_stats": EMPTY_TOKEN_STATS,
-                }))
-                continue
-
-            if payload.get("type") == "create_chat":
-                if not database:
-                    await ws.send_text(json.dumps({"type": "error", "content": "Select a database first."}))
-                    continue
-                title = payload.get("title", "Новый чат") or "Новый чат"
-                chat = create_chat(database, title)
-                chat_id = chat["id"]
-                await ws.send_text(json.dumps({
-                    "type": "chat_created",
-                    "chat": chat,
-                }))
-                await ws.send_text(json.dumps({
-                    "type": "history_loaded",
-                    "messages": [],
-                    "token_stats": get_chat_token_stats(chat_id),
-                }))
-                continue
-
-            if payload.get("type") == "message":
-                if not database:
-                    await ws.send_text(json.dumps({
-                        "type": "error",
-                        "content": "Please select a database first.",
-                    }))
-                    continue
-                if chat_id is None:
-                    await ws.send_text(json.dumps({
-                        "type": "error",
-                        "content": "Please select or create a chat first.",
-                    }))
-                    continue
-
-                user_text = (payload.get("content") or "").strip()
-                attachments = payload.get("attachments") or []
-                if isinstance(attachments, list):
-                    attachments = [str(a) for a in attachments]
-                else:
-                    attachments = []
-
-                combined_parts = []
-                chat_dir = FILES_DIR / str(chat_id)
-                log.info("Message attachments: %s (chat_id=%s, dir=%s)", attachments, chat_id, chat_dir)
-                for att_name in attachments:
-                    safe = sanitize_filename(att_name)
-                    if not safe:
-                        continue
-                    path = chat_dir / safe
-                    if not path.is_file():
-                        log.warning("Attachment not found: %s (chat_id=%s) path=%s", safe, chat_id, path)
-                        continue
-                    try:
-                        content = path.read_text(encoding="utf-8")
-                        combined_parts.append(f"Attached file: {safe}\n\n{content}\n\n---\n\n")
-                        log.info("Read attachment %s: %d chars", safe, len(content))
-                    except Exception as e:
-                        log.warning("Failed to read attachment %s: %s", safe, e)
-
-                if combined_parts:
-                    full_content = "".join(combined_parts) + (user_text or "")
-                else:
-                    full_content = user_text or ""
-
-                user_msg = ChatMessage(role="user", content=full_content)
-                append_chat_messages(chat_id, [user_msg])
-
-                await run_agent_loop(ws, database, agent_role, chat_id)
-                continue
+            payload = orjson.loads(raw)
+
+            handler = _HANDLERS.get(payload.get("type"))
+            if handler is not None:
+                await handler(ws, payload, state)
 
     except WebSocketDisconnect:
         log.info("Client disconnected")
     except Exception as e:
         log.exception("WebSocket error")
         try:
-            await ws.send_text(json.dumps({"type": "error", "content": str(e)}))
+            await send_json(ws, {"type": "error", "content": str(e)})
         except Exception:
             pass
+    finally:
+        # Background writes outlive the socket; wait so a dropped connection never loses a turn
+        for cid in state.written_chat_ids:
+            await wait_for_pending_writes(cid)
@@ -23,6 +23,7 @@ const EMPTY_TOKEN_STATS = {
 };
 
 let ws = null;
+const wsDecoder = new TextDecoder(); // server sends JSON as binary frames
 let currentDatabase = null;
 let currentChatId = null;
 let databases = []; // [{name, description}]
@@ -162,6 +163,7 @@ function finalizeAssistantHtml(container) {
 function connectWS() {
     const protocol = location.protocol === "https:" ? "wss:" : "ws:";
     ws = new WebSocket(`${protocol}//${location.host}/ws`);
+    ws.binaryType = "arraybuffer";
 
     ws.onopen = () => {
         console.log("[WS] Connected");
@@ -189,7 +191,8 @@ function connectWS() {
     ws.onmessage = (event) => {
         let data;
         try {
-            data = JSON.parse(event.data);
+            const text = typeof event.data === "string" ? event.data : wsDecoder.decode(event.data);
+            data = JSON.parse(text);
         } catch (e) {
             console.error("[WS] Invalid JSON:", e);
             return;
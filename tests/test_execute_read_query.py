@@ -0,0 +1,31 @@
+import sys
+import unittest
+
+import backend.ai.tools  # noqa: F401  (the package re-exports the function under the module's name)
+
+erq = sys.modules["backend.ai.tools.execute_read_query"]
+
+
+class ScanQueryTest(unittest.TestCase):
+    def test_allows_plain_select(self):
+        self.assertIsNone(erq._scan_query("select id from t where x = 1").error)
+
+    def test_ignores_keywords_in_literals_and_comments(self):
+        self.assertIsNone(erq._scan_query("select 'delete', [update] from t -- drop\n").error)
+
+    def test_rejects_keyword_glued_to_number(self):
+        for query in ("SELECT 1DELETE FROM t", "select 1UPDATE t set x = 1", "select 1.5e3drop table t"):
+            with self.subTest(query=query):
+                self.assertIsNotNone(erq._scan_query(query).error)
+
+    def test_unterminated_comment_is_not_cacheable(self):
+        for query in ("select 1 /* open", "select 1 /*/", "select 1 /*"):
+            with self.subTest(query=query):
+                scanned = erq._scan_query(query)
+                self.assertIsNone(scanned.error)
+                self.assertFalse(scanned.cacheable)
+        self.assertTrue(erq._scan_query("select 1 /* closed */").cacheable)
+
+
+if __name__ == "__main__":
+    unittest.main()